@@ -0,0 +1,49 @@
+import argparse
+import json
+import time
+from client.src.order_codec import CODECS
+from client.src.simple_order import SimpleOrder
+
+
+class LegacyOrderCodec:
+    name = 'legacy'
+
+    def encode(self, order: SimpleOrder):
+        return order.model_dump_json()
+
+    def decode(self, body):
+        return SimpleOrder(**json.loads(body))
+
+
+def measure(function, items, repeat: int):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.process_time()
+        for item in items:
+            function(item)
+        best = min(best, time.process_time() - start)
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Custo de CPU por mensagem de cada codec de SimpleOrder.')
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    orders = [SimpleOrder.create_random() for _ in range(args.messages)]
+    codecs = [LegacyOrderCodec(), *CODECS.values()]
+
+    print(f"{'codec':<8} {'encode us/msg':>14} {'decode us/msg':>14} {'bytes/msg':>10}")
+    for codec in codecs:
+        bodies = [codec.encode(order) for order in orders]
+        assert codec.decode(bodies[0]) == orders[0]
+
+        encode = measure(codec.encode, orders, args.repeat)
+        decode = measure(codec.decode, bodies, args.repeat)
+        size = sum(len(body) for body in bodies) / len(bodies)
+        print(f"{codec.name:<8} {encode:>14.2f} {decode:>14.2f} {size:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import contextlib
+import functools
+import os
+import threading
+import time
+from client.src.client_service import ClientService
+from config import topology
+from core.memory_broker import MemoryBroker, MemoryRabbit
+from core.order_store import OrderStore
+from core.settings import settings
+from delivery.src.delivery_service import DeliveryService
+from order.src.order_service import OrderService
+
+PIPELINE = ["CRIADO", "CONFIRMADO", "EM ROTA", "ENTREGUE", "RECEBIDO", "FINALIZADO"]
+
+
+class TimelineRecorder:
+    def __init__(self):
+        self.timelines = {}
+        self.finished = 0
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+
+    def record(self, order_id: str, status: str):
+        now = time.perf_counter()
+        with self._lock:
+            timeline = self.timelines.setdefault(order_id, {})
+            if status in timeline:
+                return
+            timeline[status] = now
+            if status == PIPELINE[-1]:
+                self.finished += 1
+                self._done.notify_all()
+
+    def wait(self, count: int, timeout: float):
+        with self._done:
+            return self._done.wait_for(lambda: self.finished >= count, timeout)
+
+
+class RecordingOrderStore(OrderStore):
+    def __init__(self, recorder: TimelineRecorder, terminal_statuses):
+        super().__init__(terminal_statuses, retention_seconds=3600.0, max_terminal=10 ** 7)
+        self.recorder = recorder
+
+    def _on_change(self, record):
+        self.recorder.record(record.order_id, record.status)
+
+
+def percentiles(samples):
+    if not samples:
+        return [float('nan')] * 4
+    samples = sorted(samples)
+    last = len(samples) - 1
+    return [samples[round(last * q)] * 1000 for q in (0.5, 0.9, 0.99, 1.0)]
+
+
+def run(orders: int, rate: float, timeout: float):
+    broker = MemoryBroker()
+    recorder = TimelineRecorder()
+    transport = functools.partial(MemoryRabbit, broker)
+
+    services = [
+        OrderService(RecordingOrderStore(recorder, ("FINALIZADO",)), transport),
+        DeliveryService(RecordingOrderStore(recorder, ("ENTREGUE",)), transport),
+        ClientService(RecordingOrderStore(recorder, ("RECEBIDO",)), transport),
+    ]
+    client = services[-1]
+
+    for service in services:
+        service.start()
+
+    interval = 1.0 / rate if rate > 0 else 0.0
+    started = time.perf_counter()
+    admitted = 0
+    for sent in range(orders):
+        if interval:
+            delay = started + sent * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        admitted += bool(client.send_order())
+    sent_at = time.perf_counter()
+
+    completed = recorder.wait(admitted, timeout)
+    elapsed = time.perf_counter() - started
+
+    for service in services:
+        service.stop()
+    broker.close()
+
+    return (recorder, broker, elapsed, sent_at - started, completed, client.admission.stats(),
+            services[1].dispatcher.stats())
+
+
+def report(recorder: TimelineRecorder, broker: MemoryBroker, elapsed: float, publish_time: float, completed: bool,
+           admission, dispatch):
+    timelines = [timeline for timeline in recorder.timelines.values() if PIPELINE[-1] in timeline]
+    stats = broker.stats()
+
+    print(f"pedidos finalizados: {len(timelines)}/{len(recorder.timelines)}"
+          f"{'' if completed else ' (timeout)'}")
+    print(f"tempo de envio: {publish_time:.2f}s, tempo total: {elapsed:.2f}s")
+    print(f"throughput: {len(timelines) / elapsed:.0f} pedidos/s, "
+          f"{stats['delivered'] / elapsed:.0f} entregas de mensagens/s")
+    dead_lettered = sum(count for (queue, _), count in broker.dead_lettered.items() if queue in topology.WORK_QUEUES)
+    dlq_rate = dead_lettered / stats['published'] if stats['published'] else 0.0
+    print(f"mensagens publicadas: {stats['published']}, dead-letter: {dead_lettered} ({dlq_rate:.2%})")
+    print(f"admissão: {admission['admitted']} aceitos, {admission['rejected']} recusados, "
+          f"taxa final {admission['rate']:.1f} pedidos/s, vazão estimada {admission['throughput']:.1f} pedidos/s")
+    print(f"despacho: {dispatch['routes']} rotas, {dispatch['orders_per_route']} pedidos por rota, "
+          f"{dispatch['couriers']} entregadores com utilização de {dispatch['utilization']:.0%}")
+
+    print()
+    print(f"{'latência (ms)':<26} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+    rows = [(f"{PIPELINE[0]} -> {PIPELINE[-1]}", PIPELINE[0], PIPELINE[-1])]
+    rows += [(f"{a} -> {b}", a, b) for a, b in zip(PIPELINE, PIPELINE[1:])]
+    for name, start, end in rows:
+        samples = [timeline[end] - timeline[start] for timeline in timelines]
+        p50, p90, p99, worst = percentiles(samples)
+        print(f"{name:<26} {p50:>9.2f} {p90:>9.2f} {p99:>9.2f} {worst:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark ponta a ponta de Cliente -> Pedidos -> Entregas com um broker em memória.')
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=0.0, help='pedidos/s (0 = sem limite)')
+    parser.add_argument('--delay-scale', type=float, default=0.0,
+                        help='multiplicador dos atrasos simulados dos serviços (0 = sem atraso)')
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--log-level', default='WARNING', help='nível de log dos serviços durante o benchmark')
+    args = parser.parse_args()
+
+    settings.simulated_delay_scale = args.delay_scale
+    settings.log_level = args.log_level
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = run(args.orders, args.rate, args.timeout)
+
+    report(*result)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import bisect
+import json
+import sys
+from collections import defaultdict
+
+BUCKETS_MS = [1, 10, 100, 1000, 10000, 60000]
+
+
+def percentile(samples, q: float):
+    return samples[round((len(samples) - 1) * q)]
+
+
+def histogram(samples):
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for sample in samples:
+        counts[bisect.bisect_left(BUCKETS_MS, sample)] += 1
+    return counts
+
+
+def load(files):
+    for file in files:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Agrega spans de TRACE_FILE em histogramas de latência por etapa.')
+    parser.add_argument('files', nargs='*', help="arquivos JSONL de spans (padrão: stdin)")
+    args = parser.parse_args()
+
+    files = [open(path, encoding='utf-8') for path in args.files] or [sys.stdin]
+
+    stages = defaultdict(lambda: {'queue_wait_ms': [], 'handler_ms': [], 'errors': 0})
+    traces = defaultdict(lambda: [float('inf'), 0.0])
+    for span in load(files):
+        stage = stages[span['queue']]
+        if span['queue_wait_ms'] is not None:
+            stage['queue_wait_ms'].append(span['queue_wait_ms'])
+        stage['handler_ms'].append(span['handler_ms'])
+        stage['errors'] += span['outcome'] != 'ok'
+
+        trace = traces[span['trace_id']]
+        if span['published_at'] is not None:
+            trace[0] = min(trace[0], span['published_at'])
+        trace[1] = max(trace[1], span['received_at'] + span['handler_ms'] / 1000)
+
+    labels = [f"<{bucket}ms" for bucket in BUCKETS_MS] + [f">={BUCKETS_MS[-1]}ms"]
+    print(f"{'etapa':<34} {'métrica':<14} {'n':>7} {'p50':>10} {'p90':>10} {'p99':>10}  " + ' '.join(f"{label:>9}" for label in labels))
+    for queue in sorted(stages):
+        stage = stages[queue]
+        for metric in ('queue_wait_ms', 'handler_ms'):
+            samples = sorted(stage[metric])
+            if not samples:
+                continue
+            print(f"{queue:<34} {metric:<14} {len(samples):>7} "
+                  f"{percentile(samples, 0.5):>10.1f} {percentile(samples, 0.9):>10.1f} {percentile(samples, 0.99):>10.1f}  "
+                  + ' '.join(f"{count:>9}" for count in histogram(samples)))
+        if stage['errors']:
+            print(f"{queue:<34} {'erros':<14} {stage['errors']:>7}")
+
+    totals = sorted((end - start) * 1000 for start, end in traces.values() if start != float('inf'))
+    if totals:
+        print()
+        print(f"traces: {len(totals)}, ponta a ponta (ms) p50 {percentile(totals, 0.5):.1f} "
+              f"p90 {percentile(totals, 0.9):.1f} p99 {percentile(totals, 0.99):.1f} max {totals[-1]:.1f}")
+
+    for file in files:
+        if file is not sys.stdin:
+            file.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+from .client_service import ClientService
+from .order_codec import decode_order
+from core.service import AsyncService
+from core.settings import settings
+from core.simulation import simulated_delay
+
+class AsyncClientService(AsyncService, ClientService):
+    def __init__(self, order_interval: float = settings.client_order_interval, order_store=None):
+        self.order_interval = order_interval
+        super().__init__(order_store)
+
+    def start_admission(self):
+        pass
+
+    async def setup(self):
+        await super().setup()
+
+        if self.order_interval > 0:
+            self.runtime.spawn_background(self.order_generator())
+        if self.admission.enabled:
+            self.runtime.spawn_background(self.admission_sampler())
+
+    async def order_generator(self):
+        while True:
+            while (delay := self.admission.wait_time()) > 0 and not self.admission.shedding:
+                await asyncio.sleep(delay)
+            self.send_order(wait=0.0)
+            await asyncio.sleep(self.order_interval)
+
+    async def admission_sampler(self):
+        while True:
+            await asyncio.sleep(self.admission.interval)
+            try:
+                self.admission.record({queue: await self.admission.depth(queue)
+                                       for queue in self.admission.physical_queues()})
+            except Exception as e:
+                self.log.warning(f"Falha ao medir filas: {e!r}.")
+
+    async def delivery_notification_callback(self, ch, method, properties, body):
+        order_object = decode_order(body, properties)
+
+        self.orders.track(order_object)
+
+        if self.already_received(order_object):
+            self.log.info(f"Pedido {order_object.order_id} já foi recebido.", order_id=order_object.order_id)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        await asyncio.sleep(simulated_delay(3, 15))
+
+        order_id = order_object.order_id
+        if order_object.status == "ENTREGUE":
+            self.update_order_status(order_id, "RECEBIDO")
+            self.print_order_status(order_id)
+            self._publish_order(exchange='pedido_status_exchange',
+                                routing_key='pedido.status',
+                                order=self.orders.get(order_id))
+        else:
+            self.update_order_status(order_id, order_object.status)
+            self.print_order_status(order_id)
+
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+    async def order_confirmed_callback(self, ch, method, properties, body):
+        order_object = decode_order(body, properties)
+
+        self.orders.track(order_object)
+
+        await asyncio.sleep(simulated_delay(3, 15))
+
+        order_id = order_object.order_id
+        self.update_order_status(order_id, order_object.status)
+        self.print_order_status(order_id)
+
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+if __name__ == '__main__':
+    svc = AsyncClientService()
+    svc.run()
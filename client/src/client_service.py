@@ -1,148 +1,58 @@
-import json
-import random
+import argparse
+import itertools
+import sys
 import time
-import pika
-import uuid
 import threading
+from pydantic import ValidationError
+from .order_codec import decode_order, get_codec
 from .simple_order import SimpleOrder
+from config import topology
+from config.rabbit_mq_config import retry_dead_letter
+from core.admission import create_admission_controller
+from core.service import Service
 from core.settings import settings
-
-class ClientService:
-    def __init__(self):
-        self.service_id = str(uuid.uuid4())[:8]
-        self.orders = {}
-
-        credentials = pika.PlainCredentials(
-            settings.rabbitmq_user, 
-            settings.rabbitmq_pass
-        )
-
-        parameters = pika.ConnectionParameters(
-            settings.rabbitmq_host,
-            settings.rabbitmq_port,
-            settings.rabbitmq_vhost,
-            credentials
-        )
-        
-        self.__consumer_service_setup(parameters)
-        self.__producer_service_setup(parameters)
-                
-        self._consume_thread = None        
-        print(f"[Clientes {self.service_id}] Serviço iniciado.")
-        
-
-    def __consumer_service_setup(self, parameters):
-        self.connection_consumer = pika.BlockingConnection(parameters)
-        self.channel_consumer = self.connection_consumer.channel()
-        self.__set_entrega_service()
-        self.__set_pedido_confirmado_service()
-
-    def __set_entrega_service(self):
-        self.channel_consumer.exchange_declare(exchange='entrega_dlx',
-                                            exchange_type='fanout',
-                                            durable=True)
-
-        self.entrega_dead_queue = self.channel_consumer.queue_declare(
-            queue='entrega_dead_queue', durable=True
-        ).method.queue
-
-        self.channel_consumer.queue_bind(exchange='entrega_dlx',
-                                        queue=self.entrega_dead_queue)
-
-        self.channel_consumer.basic_consume(queue=self.entrega_dead_queue,
-                                        on_message_callback=self.dl_delivery_callback,
-                                        auto_ack=False)
-        arguments = {
-            'x-message-ttl': 30000,
-            'x-dead-letter-exchange': 'entrega_dlx'
-        }
-    
-        self.channel_consumer.exchange_declare(exchange='entrega_exchange',
-                                        exchange_type='topic',
-                                        durable=True)
-        
-        self.notificar_queue = self.channel_consumer.queue_declare(
-            queue='notificar_queue', durable=True, arguments=arguments
-        ).method.queue
-        
-        self.channel_consumer.queue_bind(exchange='entrega_exchange',
-                                queue=self.notificar_queue,
-                                routing_key='entrega.*')
-        
-        self.channel_consumer.basic_consume(queue=self.notificar_queue,
-                                    on_message_callback=self.delivery_notification_callback,
-                                    auto_ack=False)
-        
-    def __set_pedido_confirmado_service(self):
-        self.channel_consumer.exchange_declare(exchange='pedido_confirmado_dlx',
-                                            exchange_type='fanout',
-                                            durable=True)
-
-        self.pedido_confirmado_dead_queue = self.channel_consumer.queue_declare(
-            queue='pedido_confirmado_dead_queue', durable=True
-        ).method.queue
-
-        self.channel_consumer.queue_bind(exchange='pedido_confirmado_dlx',
-                                        queue=self.pedido_confirmado_dead_queue)
-        
-        self.channel_consumer.basic_consume(queue=self.pedido_confirmado_dead_queue,
-                                        on_message_callback=self.dl_order_confirmed_callback,
-                                        auto_ack=False)
-        
-        arguments = {
-            'x-message-ttl': 30000,
-            'x-dead-letter-exchange': 'pedido_confirmado_dlx'
-        }
-
-        self.channel_consumer.exchange_declare(exchange='pedido_confirmado_exchange',
-                                                exchange_type='topic',
-                                                durable=True)
-
-        self.pedido_confirmado_queue = self.channel_consumer.queue_declare(
-            queue='confirmado_cliente_queue', durable=True, arguments=arguments
-        ).method.queue
-
-        self.channel_consumer.queue_bind(exchange='pedido_confirmado_exchange',
-                                        queue=self.pedido_confirmado_queue,
-                                        routing_key='pedido.confirmado.*') 
-        
-        self.channel_consumer.basic_consume(queue=self.pedido_confirmado_queue,
-                                            on_message_callback=self.order_confirmed_callback,
-                                            auto_ack=False)
-
-    def __producer_service_setup(self, parameters):
-        self.connection_publisher = pika.BlockingConnection(parameters)
-        self.channel_publisher = self.connection_publisher.channel()
-        
-        self.channel_publisher.exchange_declare(exchange='pedido_status_exchange',
-                                               exchange_type='direct',
-                                               durable=True
-        )
+from core.simulation import simulated_delay
+
+class ClientService(Service):
+    def __init__(self, order_store=None, transport=None):
+        super().__init__("Clientes", 'client', ("RECEBIDO",), order_store, transport,
+                         prefetch_count=settings.client_prefetch_count,
+                         worker_pool_size=settings.client_worker_pool_size)
+
+        self.admission = create_admission_controller(self.label, self.transport.queue_depth)
+        self.start_admission()
+
+    def start_admission(self):
+        self.admission.start()
+
+    def consumers(self):
+        return [
+            ('notificar_dead_queue', self.dl_delivery_callback),
+            ('notificar_queue', self.delivery_notification_callback),
+            ('confirmado_cliente_dead_queue', self.dl_order_confirmed_callback),
+            ('confirmado_cliente_queue', self.order_confirmed_callback),
+        ]
  
     def delivery_notification_callback(self, ch, method, properties, body):
-        order_json = json.loads(body)
-        order_object = SimpleOrder(**order_json)
+        order_object = decode_order(body, properties)
 
-        if self.orders.get(order_object.order_id) is None:
-            self.orders[order_object.order_id] = order_object
+        self.orders.track(order_object)
             
-        if order_object.status == "RECEBIDO":
-            print(f"[Clientes {self.service_id}] Pedido {order_object.order_id} já foi recebido.")
+        if self.already_received(order_object):
+            self.log.info(f"Pedido {order_object.order_id} já foi recebido.", order_id=order_object.order_id)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
             return
         
-        time.sleep(random.randint(3, 15))
+        time.sleep(simulated_delay(3, 15))
 
         if order_object.status == "ENTREGUE":
             order_id = order_object.order_id
             self.update_order_status(order_id, "RECEBIDO")
             self.print_order_status(order_id)
            
-            self.channel_publisher.basic_publish(exchange='pedido_status_exchange',
-                            routing_key='pedido.status',
-                            body=self.orders[order_object.order_id].model_dump_json(),
-                            properties=pika.BasicProperties(
-                                delivery_mode=pika.DeliveryMode.Persistent
-            ))
+            self._publish_order(exchange='pedido_status_exchange',
+                                routing_key='pedido.status',
+                                order=self.orders.get(order_object.order_id))
         else:
             order_id = order_object.order_id
             self.update_order_status(order_id, order_object.status)
@@ -150,14 +60,15 @@ class ClientService:
         
         ch.basic_ack(delivery_tag=method.delivery_tag)
         
+    def already_received(self, order: SimpleOrder):
+        return "RECEBIDO" in (order.status, self.orders.status(order.order_id))
+
     def order_confirmed_callback(self, ch, method, properties, body):
-        order_json = json.loads(body)
-        order_object = SimpleOrder(**order_json)
+        order_object = decode_order(body, properties)
 
-        if self.orders.get(order_object.order_id) is None:
-            self.orders[order_object.order_id] = order_object
+        self.orders.track(order_object)
         
-        time.sleep(random.randint(3, 15))
+        time.sleep(simulated_delay(3, 15))
         
         order_id = order_object.order_id
         self.update_order_status(order_id, order_object.status)
@@ -165,126 +76,180 @@ class ClientService:
         
         ch.basic_ack(delivery_tag=method.delivery_tag)
  
-    def send_order(self):
+    def send_order(self, wait: float = settings.admission_wait_timeout):
+        if not self.admission.admit(wait):
+            self.log.warning("Pedido recusado: filas de processamento sobrecarregadas.",
+                             backlog=self.admission.backlog, rate=round(self.admission.bucket.rate, 1))
+            return False
+
         order = SimpleOrder.create_random()
 
-        if self.orders.get(order.order_id) is not None:
-            print(f"[Entregas {self.service_id}] Pedido {order.order_id} já existe.")
-            return
+        if order.order_id in self.orders:
+            self.log.info(f"Pedido {order.order_id} já existe.", order_id=order.order_id)
+            return False
 
-        self.orders[order.order_id] = order
+        self.orders.track(order)
         
-        self.channel_publisher.basic_publish(exchange='pedido_status_exchange',
-                                   routing_key='pedido.status',
-                                   body=order.model_dump_json(),
-                                   properties=pika.BasicProperties(
-                                       delivery_mode=pika.DeliveryMode.Persistent
-                                   ))
+        self._publish_order(exchange='pedido_status_exchange',
+                            routing_key='pedido.status',
+                            order=order)
         
         order_id = order.order_id
         self.update_order_status(order_id, "ENVIADO")
         self.print_order_status(order_id)
-
-
-    def _extract_original_routing_key(self, properties, default):
-        try:
-            headers = properties.headers or {}
-            x_death = headers.get('x-death')
-            if x_death and isinstance(x_death, list) and len(x_death) > 0:
-                first = x_death[0]
-                if 'routing-keys' in first and isinstance(first['routing-keys'], list) and len(first['routing-keys']) > 0:
-                    return first['routing-keys'][0]
-                if 'routing_key' in first:
-                    return first['routing_key']
-        except Exception:
-            pass
-        return default
+        return True
+
+    def submit_orders(self, orders, batch_size: int = settings.client_bulk_batch_size):
+        source, orders = orders, iter(orders)
+        publisher = self.rabbit.publisher
+        blocked_before = publisher.blocked_seconds
+        started = reported = time.monotonic()
+        submitted = skipped = 0
+
+        while True:
+            batch = list(itertools.islice(orders, batch_size))
+            if not batch:
+                break
+
+            messages = []
+            for order in batch:
+                if order.order_id in self.orders:
+                    skipped += 1
+                    continue
+                self.orders.track(order)
+                self.update_order_status(order.order_id, "ENVIADO")
+                messages.append(self.order_message(order))
+
+            self.admission.throttle(len(messages))
+            submitted += self.rabbit.publish_batch('pedido_status_exchange', 'pedido.status', messages,
+                                                   content_type=self.codec.content_type,
+                                                   priority=topology.priority("CRIADO"))
+            now = time.monotonic()
+            if now - reported >= 1.0:
+                reported = now
+                self.log.info(f"{submitted} pedidos enviados ({submitted / (now - started):.0f} msgs/s).",
+                              submitted=submitted)
+
+        if not self.rabbit.flush(timeout=60.0):
+            self.log.warning("Confirmações pendentes após 60s.")
+
+        elapsed = time.monotonic() - started
+        rate = submitted / elapsed if elapsed > 0 else 0.0
+        blocked = publisher.blocked_seconds - blocked_before
+        invalid = getattr(source, 'invalid', 0)
+        self.log.info(f"Lote concluído: {submitted} pedidos confirmados em {elapsed:.2f}s ({rate:.0f} msgs/s), "
+                      f"{skipped} duplicados ignorados, {invalid} linhas inválidas, "
+                      f"{blocked:.2f}s em controle de fluxo.",
+                      submitted=submitted, skipped=skipped, invalid=invalid, rate=round(rate, 1),
+                      blocked_seconds=round(blocked, 3))
+        return submitted
 
     def dl_delivery_callback(self, ch, method, properties, body):
-        routing_key = self._extract_original_routing_key(properties, default='entrega.retry')
-        try:
-            self.channel_publisher.basic_publish(
-                exchange='entrega_exchange',
-                routing_key=routing_key,
-                body=body,
-                properties=pika.BasicProperties(
-                    delivery_mode=pika.DeliveryMode.Persistent,
-                    headers=properties.headers
-                )
-            )
-            print(f"[Clientes {self.service_id}] Mensagem da DLQ entrega republicada para entrega_exchange ({routing_key}).")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"[Clientes {self.service_id}] Falha ao republicar da DLQ entrega: {e}. Requeue na DLQ.")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        retry_dead_letter(self._publish, self.log, ch, method, properties, body,
+                          queue='notificar_queue')
 
     def dl_order_confirmed_callback(self, ch, method, properties, body):
-        routing_key = self._extract_original_routing_key(properties, default='pedido.confirmado.retry')
-        try:
-            self.channel_publisher.basic_publish(
-                exchange='pedido_confirmado_exchange',
-                routing_key=routing_key,
-                body=body,
-                properties=pika.BasicProperties(
-                    delivery_mode=pika.DeliveryMode.Persistent,
-                    headers=properties.headers
-                )
-            )
-            print(f"[Clientes {self.service_id}] Mensagem da DLQ pedido_confirmado republicada para pedido_confirmado_exchange ({routing_key}).")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"[Clientes {self.service_id}] Falha ao republicar da DLQ pedido_confirmado: {e}. Requeue na DLQ.")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-
-    
-    def update_order_status(self, order_id: str, new_status: str):
-        order = self.orders[order_id]
-        if order:
-            order.status = new_status
-            
-    def print_order_status(self, order_id: str):
-        order_object = self.orders[order_id]
-        if order_object is not None:
-            print(f"[Clientes {self.service_id}] Pedido {order_object.order_id} {order_object.status}.")
+        retry_dead_letter(self._publish, self.log, ch, method, properties, body,
+                          queue='confirmado_cliente_queue')
 
     def listen(self):
-        print(f"[Clientes {self.service_id}] Aguardando atualizações...")
-        self.channel_consumer.start_consuming()
+        self.log.info("Aguardando atualizações...")
+        self.rabbit.start_consuming()
+        self.rabbit.drain(time.monotonic() + settings.drain_timeout)
+
+    def run_bulk(self, orders, batch_size: int = settings.client_bulk_batch_size):
+        try:
+            self.submit_orders(orders, batch_size)
+        except KeyboardInterrupt:
+            self.log.info("Keyboard interruption.")
+        finally:
+            self.stop()
+
+    def start(self):
+        self._consume_thread = threading.Thread(target=self.listen, daemon=True)
+        self._consume_thread.start()
+
+    def stop(self):
+        if self._consume_thread is not None:
+            self.rabbit.stop_consuming()
+            self._consume_thread.join()
+            self._consume_thread = None
+        self.admission.stop()
+        self.rabbit.close()
+        self.orders.close()
+        self.tracer.close()
+
+        self.log.info("Conexão fechada.")
+
+    def serve(self, stopped: threading.Event):
+        self.start()
+        stopped.wait()
+        self.log.info("Encerrando.")
+        self.stop()
 
     def run(self):
-        
-        consumer_thread = threading.Thread(target=self.listen, daemon=True)
-        consumer_thread.start()
+        self.start()
         
         try:
-            print(f"[Clientes {self.service_id}] Pressione Enter para fazer um pedido ou 'q' para sair.")
+            self.log.info("Pressione Enter para fazer um pedido ou 'q' para sair.")
 
             while True:
                 user_input = input()
                 
                 if user_input.lower() == 'q':
-                    print(f"[Clientes {self.service_id}] Encerrando.")
+                    self.log.info("Encerrando.")
                     break
                 
                 self.send_order()
                 
         except KeyboardInterrupt:
-            print(f"\n[Clientes {self.service_id}] Keyboard interruption.")
+            self.log.info("Keyboard interruption.")
         
         finally:
-            if self.channel_consumer.is_open:
-                self.channel_consumer.connection.add_callback_threadsafe(
-                    lambda: self.channel_consumer.stop_consuming()  
-                )
+            self.stop()
 
-            consumer_thread.join()
-            
-            if self.connection_consumer.is_open:
-                self.connection_consumer.close()
-            
-            print(f"[Clientes {self.service_id}] Conexão fechada.")
+
+class OrderLines:
+    def __init__(self, lines, log):
+        self.lines = lines
+        self.log = log
+        self.invalid = 0
+
+    def __iter__(self):
+        codec = get_codec('json')
+        for number, line in enumerate(self.lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield codec.decode(line)
+            except ValidationError as e:
+                self.invalid += 1
+                error = e.errors()[0]
+                field = '.'.join(str(part) for part in error['loc'])
+                self.log.warning(f"Linha {number} inválida ignorada: {error['msg']}{f' ({field})' if field else ''}.",
+                                 line=number)
+
+
+def random_orders(count: int):
+    for _ in range(count):
+        yield SimpleOrder.create_random()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bulk', metavar='ARQUIVO', help="arquivo JSONL de pedidos ('-' para stdin)")
+    parser.add_argument('--random', type=int, metavar='N', help='envia N pedidos aleatórios em lote')
+    parser.add_argument('--batch-size', type=int, default=settings.client_bulk_batch_size)
+    args = parser.parse_args()
+
     svc = ClientService()
-    svc.run()
\ No newline at end of file
+    if args.bulk == '-':
+        svc.run_bulk(OrderLines(sys.stdin, svc.log), args.batch_size)
+    elif args.bulk:
+        with open(args.bulk, encoding='utf-8') as file:
+            svc.run_bulk(OrderLines(file, svc.log), args.batch_size)
+    elif args.random:
+        svc.run_bulk(random_orders(args.random), args.batch_size)
+    else:
+        svc.run()
\ No newline at end of file
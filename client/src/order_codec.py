@@ -0,0 +1,68 @@
+import struct
+from pydantic import TypeAdapter
+from .simple_order import SimpleOrder
+
+JSON_CONTENT_TYPE = 'application/json'
+BINARY_CONTENT_TYPE = 'application/x-simple-order'
+
+
+class JsonOrderCodec:
+    name = 'json'
+    content_type = JSON_CONTENT_TYPE
+
+    def __init__(self):
+        self.adapter = TypeAdapter(SimpleOrder)
+
+    def encode(self, order: SimpleOrder):
+        return self.adapter.dump_json(order)
+
+    def decode(self, body):
+        return self.adapter.validate_json(body)
+
+
+class BinaryOrderCodec:
+    name = 'binary'
+    content_type = BINARY_CONTENT_TYPE
+    header = struct.Struct('<qdHHH')
+
+    def __init__(self):
+        self.adapter = TypeAdapter(SimpleOrder)
+
+    def encode(self, order: SimpleOrder):
+        order_id = order.order_id.encode()
+        product = order.product.encode()
+        status = order.status.encode()
+        return b''.join((
+            self.header.pack(order.quantity, order.unit_price, len(order_id), len(product), len(status)),
+            order_id,
+            product,
+            status,
+        ))
+
+    def decode(self, body):
+        quantity, unit_price, order_id_size, product_size, status_size = self.header.unpack_from(body)
+        product_start = self.header.size + order_id_size
+        status_start = product_start + product_size
+        order_id = body[self.header.size:product_start].decode()
+        product = body[product_start:status_start].decode()
+        status = body[status_start:status_start + status_size].decode()
+
+        return self.adapter.validate_python({'order_id': order_id,
+                                             'product': product,
+                                             'quantity': quantity,
+                                             'unit_price': unit_price,
+                                             'status': status})
+
+
+CODECS = {codec.name: codec for codec in (JsonOrderCodec(), BinaryOrderCodec())}
+CODECS_BY_CONTENT_TYPE = {codec.content_type: codec for codec in CODECS.values()}
+
+
+def get_codec(name: str):
+    return CODECS[name]
+
+
+def decode_order(body, properties=None):
+    content_type = getattr(properties, 'content_type', None)
+    codec = CODECS_BY_CONTENT_TYPE.get(content_type, CODECS['json'])
+    return codec.decode(body)
@@ -1,50 +1,259 @@
+import threading
+import time
 import pika
+from config import topology
+from core.backoff import Backoff
+from core.log import get_logger
+from core.metrics import DLQ_REPUBLISHED
+from core.publisher import ConfirmedPublisher
 from core.settings import settings
+from core.worker_pool import create_worker_pool, guard
+
+
+def connection_parameters():
+    credentials = pika.PlainCredentials(
+        settings.rabbitmq_user,
+        settings.rabbitmq_pass
+    )
+
+    return pika.ConnectionParameters(
+        settings.rabbitmq_host,
+        settings.rabbitmq_port,
+        settings.rabbitmq_vhost,
+        credentials
+    )
+
+
+def death_count(properties, queue: str):
+    headers = properties.headers or {}
+    total = 0
+    for entry in headers.get('x-death') or []:
+        if topology.logical_queue(entry.get('queue')) == queue:
+            total += int(entry.get('count', 1))
+    return total
+
+
+
+def retry_dead_letter(publish, log, ch, method, properties, body, queue: str):
+    attempt = max(death_count(properties, queue), 1)
+    try:
+        if attempt > settings.retry_max_attempts:
+            target = topology.parking_queue(queue)
+            DLQ_REPUBLISHED.inc(queue, 'parked')
+            message = f"estacionada em {target} após {attempt - 1} tentativas"
+        else:
+            target = topology.retry_queue(queue, attempt)
+            DLQ_REPUBLISHED.inc(queue, 'retried')
+            message = f"reagendada para {queue} em {topology.retry_delay(attempt)} ms, tentativa {attempt}"
+
+        publish(exchange='',
+                routing_key=target,
+                body=body,
+                headers=properties.headers,
+                content_type=properties.content_type,
+                priority=properties.priority)
+        log.info(f"Mensagem da DLQ de {queue} {message}.", queue=queue, attempt=attempt)
+        # publish só enfileira a cópia no publicador; o ack da DLQ não espera a confirmação do broker.
+        # O reenvio é at-most-once: o nack abaixo só cobre falhas locais, como o publicador fechado.
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+    except Exception as e:
+        log.error(f"Falha ao reagendar da DLQ de {queue}: {e}. Requeue na DLQ.", queue=queue, attempt=attempt)
+        ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+
 
 class RabbitMQConfig:
-    
-    def __init__(self):
-        self.credentials = pika.PlainCredentials(
-            settings.rabbitmq_user, 
-            settings.rabbitmq_pass
-        )
-
-        self.parameters = pika.ConnectionParameters(
-            settings.rabbitmq_host,
-            settings.rabbitmq_port,
-            settings.rabbitmq_vhost,
-            self.credentials
-        )
-        
+    _declared = set()
+    _publishers = {}
+    _publishers_lock = threading.Lock()
+
+    def __init__(self, label: str, prefetch_count: int = 10, worker_pool_size: int = 0, parameters=None):
+        self.label = label
+        self.log = get_logger(label)
+        self.parameters = parameters or connection_parameters()
+        self.prefetch_count = prefetch_count
+        self.backoff = Backoff(settings.reconnect_base_delay, settings.reconnect_max_delay)
+        self.reconnects = 0
+        self._consumers = []
+        self._reconnect_callbacks = []
+        self._stopping = threading.Event()
+        self._probe = None
+
+        self.connect()
+
+        self.worker_pool = create_worker_pool(worker_pool_size, label, prefetch_count)
+
+        self.publisher = self._acquire_publisher()
+
+    def connect(self):
         self.connection = pika.BlockingConnection(self.parameters)
         self.channel = self.connection.channel()
-        self.setup_exchanges()
-        self.setup_queues()
-        self.setup_bindings()
+        self.setup_topology()
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+
+    def reconnect(self):
+        while True:
+            delay = self.backoff.next()
+            self.log.warning(f"Reconectando em {delay:.1f}s.")
+            if self._stopping.wait(delay):
+                return False
+
+            RabbitMQConfig._declared.discard(topology.fingerprint())
+            try:
+                self.connect()
+                for queue, callback in self._consumers:
+                    self.channel.basic_consume(queue=queue, on_message_callback=callback, auto_ack=False)
+            except pika.exceptions.AMQPError as e:
+                self.log.warning(f"Falha ao reconectar: {e!r}.")
+                continue
+
+            for callback in self._reconnect_callbacks:
+                callback(self.connection)
+            self.backoff.reset()
+            self.reconnects += 1
+            self.log.info(f"Reconectado, {len(self._consumers)} consumidores restabelecidos.")
+            return True
+
+    def on_reconnect(self, callback):
+        self._reconnect_callbacks.append(callback)
+
+    def setup_topology(self):
+        fingerprint = topology.fingerprint()
+        if fingerprint in RabbitMQConfig._declared:
+            return
+
+        try:
+            self.channel.exchange_declare(exchange=topology.marker_exchange(), passive=True)
+        except pika.exceptions.ChannelClosedByBroker:
+            self.channel = self.connection.channel()
+            self.setup_exchanges()
+            self.setup_queues()
+            self.setup_bindings()
+            self.channel.exchange_declare(
+                exchange=topology.marker_exchange(), exchange_type='fanout', durable=True)
+
+        RabbitMQConfig._declared.add(fingerprint)
 
     def setup_exchanges(self):
-        self.channel.exchange_declare(
-            exchange='pedido_status_exchange', exchange_type='direct', durable=True)
-        self.channel.exchange_declare(
-            exchange='pedido_confirmado_exchange', exchange_type='topic', durable=True)
-        self.channel.exchange_declare(
-            exchange='entrega_exchange', exchange_type='topic', durable=True)
-        
+        for exchange, exchange_type in topology.EXCHANGES.items():
+            self.channel.exchange_declare(
+                exchange=exchange, exchange_type=exchange_type, durable=True,
+                arguments=topology.EXCHANGE_ARGUMENTS.get(exchange))
+
     def setup_queues(self):
-        self.channel.queue_declare(queue='pedido_status_queue', durable=True)
-        self.channel.queue_declare(queue='pedido_confirmado_entregador_queue', durable=True)
-        self.channel.queue_declare(queue='pedido_confirmado_cliente_queue', durable=True)
-        self.channel.queue_declare(queue='entrega_status_queue', durable=True)
-        self.channel.queue_declare(queue='entrega_notificar_queue', durable=True)
+        for queue, arguments in topology.QUEUES.items():
+            self.channel.queue_declare(queue=queue, durable=True, arguments=arguments or None)
 
     def setup_bindings(self):
-        self.channel.queue_bind(
-            exchange='pedido_status_exchange', queue='pedido_status_queue', routing_key='pedido.status')
-        self.channel.queue_bind(
-            exchange='pedido_confirmado_exchange', queue='pedido_confirmado_entregador_queue', routing_key='pedido.confirmado.entregador')
-        self.channel.queue_bind(
-            exchange='pedido_confirmado_exchange', queue='pedido_confirmado_cliente_queue', routing_key='pedido.confirmado.cliente')
-        self.channel.queue_bind(
-            exchange='entrega_exchange', queue='entrega_status_queue', routing_key='entrega.status')
-        self.channel.queue_bind(
-            exchange='entrega_exchange', queue='entrega_notificar_queue', routing_key='entrega.notificar')
\ No newline at end of file
+        for exchange, queue, routing_key in topology.BINDINGS:
+            self.channel.queue_bind(exchange=exchange, queue=queue, routing_key=routing_key)
+        for source, destination, routing_key in topology.EXCHANGE_BINDINGS:
+            self.channel.exchange_bind(destination=destination, source=source, routing_key=routing_key)
+
+    def _publisher_key(self):
+        return (self.parameters.host, self.parameters.port, self.parameters.virtual_host)
+
+    def _acquire_publisher(self):
+        key = self._publisher_key()
+        with RabbitMQConfig._publishers_lock:
+            entry = RabbitMQConfig._publishers.get(key)
+            if entry is None:
+                publisher = ConfirmedPublisher(self.parameters, f"Publicador {self.label}",
+                                               window_size=settings.publisher_confirm_window,
+                                               max_retries=settings.publisher_max_retries)
+                publisher.start()
+                entry = RabbitMQConfig._publishers[key] = [publisher, 0]
+            entry[1] += 1
+            return entry[0]
+
+    def _release_publisher(self):
+        key = self._publisher_key()
+        with RabbitMQConfig._publishers_lock:
+            entry = RabbitMQConfig._publishers.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del RabbitMQConfig._publishers[key]
+        entry[0].close()
+
+    def consume(self, queue: str, callback):
+        if self.worker_pool is not None:
+            callback = self.worker_pool.wrap(callback)
+        else:
+            callback = guard(callback, self.label)
+
+        self._consumers.append((queue, callback))
+        return self.channel.basic_consume(queue=queue,
+                                          on_message_callback=callback,
+                                          auto_ack=False)
+
+    def publish(self, exchange: str, routing_key: str, body, headers=None, content_type=None, priority=None):
+        self.publisher.publish(exchange, routing_key, body, headers=headers, content_type=content_type,
+                               priority=priority)
+
+    def publish_batch(self, exchange: str, routing_key: str, messages, content_type=None, priority=None):
+        return self.publisher.publish_batch(exchange, routing_key, messages, content_type=content_type,
+                                            priority=priority)
+
+    def flush(self, timeout: float = None):
+        return self.publisher.flush(timeout)
+
+    def queue_depth(self, queue: str):
+        try:
+            if self._probe is None or not self._probe.is_open:
+                self._probe = pika.BlockingConnection(self.parameters).channel()
+            frame = self._probe.queue_declare(queue=queue, passive=True)
+        except pika.exceptions.AMQPError:
+            self._close_probe()
+            raise
+        return frame.method.message_count, None
+
+    def _close_probe(self):
+        if self._probe is not None and self._probe.connection.is_open:
+            self._probe.connection.close()
+        self._probe = None
+
+    def start_consuming(self):
+        while not self._stopping.is_set():
+            try:
+                self.channel.start_consuming()
+                return
+            except pika.exceptions.AMQPConnectionError as e:
+                if self._stopping.is_set():
+                    return
+                self.log.warning(f"Conexão de consumo perdida: {e!r}.")
+                if not self.reconnect():
+                    return
+
+    def stop_consuming(self):
+        self._stopping.set()
+        try:
+            if self.channel.is_open:
+                self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+        except pika.exceptions.ConnectionWrongStateError:
+            pass
+
+    def _busy(self, busy):
+        if self.worker_pool is not None and self.worker_pool.in_flight:
+            return True
+        return busy is not None and busy()
+
+    def drain(self, deadline: float, busy=None):
+        while time.monotonic() < deadline and self.connection.is_open and self._busy(busy):
+            self.connection.process_data_events(time_limit=0.1)
+
+        if self.connection.is_open:
+            self.connection.process_data_events(time_limit=0)
+
+    def close(self):
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown(wait=False)
+
+        self.publisher.flush(settings.drain_timeout)
+
+        if self.connection.is_open:
+            self.connection.close()
+        self._close_probe()
+
+        self._release_publisher()
@@ -0,0 +1,162 @@
+import hashlib
+import json
+from core.settings import settings
+
+MESSAGE_TTL = 30000
+
+MARKER_PREFIX = 'delivery_q.topology'
+
+CONSISTENT_HASH = 'x-consistent-hash'
+
+SHARD_KEY_HEADER = 'x-order-id'
+
+STATUS_PRIORITY = {
+    'CRIADO': 0,
+    'CONFIRMADO': 1,
+    'EM ROTA': 2,
+    'ENTREGUE': 3,
+    'RECEBIDO': 4,
+    'FINALIZADO': 5,
+}
+
+DEAD_LETTER_EXCHANGE = 'dead_letter_exchange'
+
+EXCHANGES = {
+    'pedido_status_exchange': 'direct',
+    'pedido_confirmado_exchange': 'topic',
+    'entrega_exchange': 'topic',
+    DEAD_LETTER_EXCHANGE: 'direct',
+}
+
+EXCHANGE_ARGUMENTS = {}
+
+EXCHANGE_BINDINGS = []
+
+WORK_QUEUES = {
+    'pedido_status_queue': ('pedido_status_exchange', 'pedido.status'),
+    'confirmado_entregador_queue': ('pedido_confirmado_exchange', 'pedido.confirmado.*'),
+    'confirmado_cliente_queue': ('pedido_confirmado_exchange', 'pedido.confirmado.*'),
+    'entrega_status_queue': ('entrega_exchange', 'entrega.*'),
+    'notificar_queue': ('entrega_exchange', 'entrega.*'),
+}
+
+SHARDS = {
+    'pedido_status_queue': settings.order_shards,
+    'entrega_status_queue': settings.order_shards,
+    'confirmado_entregador_queue': settings.delivery_shards,
+    'confirmado_cliente_queue': settings.client_shards,
+    'notificar_queue': settings.client_shards,
+}
+
+
+def _base_name(queue: str):
+    return queue[:-len('_queue')] if queue.endswith('_queue') else queue
+
+
+def dead_queue(queue: str):
+    return f'{_base_name(queue)}_dead_queue'
+
+
+def retry_queue(queue: str, attempt: int):
+    return f'{_base_name(queue)}_retry_{attempt}_queue'
+
+
+def parking_queue(queue: str):
+    return f'{_base_name(queue)}_parking_queue'
+
+
+def shard_queue(queue: str, shard: int):
+    return f'{_base_name(queue)}_shard_{shard}_queue'
+
+
+def hash_exchange(queue: str):
+    return f'{_base_name(queue)}_hash_exchange'
+
+
+def direct_route(queue: str):
+    if SHARDS.get(queue, 0):
+        return hash_exchange(queue), queue
+    return '', queue
+
+
+def priority(status: str):
+    return min(STATUS_PRIORITY.get(status, 0), settings.queue_max_priority)
+
+
+def retry_delay(attempt: int):
+    return settings.retry_base_delay_ms * 2 ** (attempt - 1)
+
+
+QUEUES = {}
+BINDINGS = []
+DEAD_QUEUES = set()
+LOGICAL_QUEUES = {}
+
+for _queue, (_exchange, _routing_key) in WORK_QUEUES.items():
+    _shards = SHARDS.get(_queue, 0)
+    _work_arguments = {
+        'x-message-ttl': MESSAGE_TTL,
+        'x-dead-letter-exchange': DEAD_LETTER_EXCHANGE,
+        'x-dead-letter-routing-key': _queue
+    }
+    if settings.queue_max_priority:
+        _work_arguments['x-max-priority'] = settings.queue_max_priority
+
+    if _shards:
+        EXCHANGES[hash_exchange(_queue)] = CONSISTENT_HASH
+        EXCHANGE_ARGUMENTS[hash_exchange(_queue)] = {'hash-header': SHARD_KEY_HEADER}
+        EXCHANGE_BINDINGS.append((_exchange, hash_exchange(_queue), _routing_key))
+        for _shard in range(_shards):
+            QUEUES[shard_queue(_queue, _shard)] = dict(_work_arguments)
+            BINDINGS.append((hash_exchange(_queue), shard_queue(_queue, _shard), '1'))
+            LOGICAL_QUEUES[shard_queue(_queue, _shard)] = _queue
+        _retry_exchange = hash_exchange(_queue)
+    else:
+        QUEUES[_queue] = _work_arguments
+        BINDINGS.append((_exchange, _queue, _routing_key))
+        _retry_exchange = ''
+
+    QUEUES[dead_queue(_queue)] = {}
+    DEAD_QUEUES.add(dead_queue(_queue))
+    BINDINGS.append((DEAD_LETTER_EXCHANGE, dead_queue(_queue), _queue))
+
+    for _attempt in range(1, settings.retry_max_attempts + 1):
+        QUEUES[retry_queue(_queue, _attempt)] = {
+            'x-message-ttl': retry_delay(_attempt),
+            'x-dead-letter-exchange': _retry_exchange,
+            'x-dead-letter-routing-key': _queue
+        }
+
+    QUEUES[parking_queue(_queue)] = {}
+
+
+def logical_queue(queue: str):
+    return LOGICAL_QUEUES.get(queue, queue)
+
+
+def is_dead_queue(queue: str):
+    return queue in DEAD_QUEUES
+
+
+def physical_queues(queue: str):
+    shards = SHARDS.get(queue, 0)
+    if not shards:
+        return [queue]
+    return [shard_queue(queue, shard) for shard in range(shards)]
+
+
+def consumer_queues(queue: str):
+    shards = SHARDS.get(queue, 0)
+    if not shards:
+        return [queue]
+    return [shard_queue(queue, shard) for shard in range(shards)
+            if shard % settings.worker_count == settings.worker_index]
+
+
+def fingerprint():
+    spec = json.dumps([EXCHANGES, EXCHANGE_ARGUMENTS, EXCHANGE_BINDINGS, QUEUES, BINDINGS], sort_keys=True)
+    return hashlib.sha1(spec.encode()).hexdigest()[:12]
+
+
+def marker_exchange():
+    return f'{MARKER_PREFIX}.{fingerprint()}'
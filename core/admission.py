@@ -0,0 +1,178 @@
+import threading
+import time
+from config import topology
+from core.log import get_logger
+from core.metrics import ADMISSION_RATE, ADMISSION_REJECTED, QUEUE_DEPTH
+from core.settings import settings
+
+ADMISSION_QUEUES = ('pedido_status_queue', 'confirmado_entregador_queue')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens: float = 1):
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (tokens - self._tokens) / self.rate)
+
+    def acquire(self, tokens: float = 1, timeout: float = None):
+        with self._lock:
+            self._refill(time.monotonic())
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                return False
+            self._tokens -= tokens
+
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+class AdmissionController:
+    def __init__(self, service: str, depth, queues=ADMISSION_QUEUES, target_depth: int = 500,
+                 max_depth: int = 2000, min_rate: float = 1.0, max_rate: float = 1000.0,
+                 burst: float = 50.0, interval: float = 1.0):
+        self.service = service
+        self.log = get_logger(service)
+        self.depth = depth
+        self.queues = queues
+        self.target_depth = target_depth
+        self.max_depth = max_depth
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.interval = interval
+        self.enabled = target_depth > 0
+        self.bucket = TokenBucket(max_rate, burst)
+        self.throughput = None
+        self.backlog = 0
+        self.shedding = False
+        self.admitted = 0
+        self.rejected = 0
+        self._admitted_since = 0
+        self._entry_depth = None
+        self._sampled_at = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        ADMISSION_RATE.set_function(lambda: self.bucket.rate, service)
+
+    def admit(self, timeout: float = 0.0):
+        if not self.enabled:
+            return True
+        if self.shedding or not self.bucket.acquire(1, timeout):
+            self.rejected += 1
+            ADMISSION_REJECTED.inc(self.service, 'shed' if self.shedding else 'throttled')
+            return False
+
+        with self._lock:
+            self.admitted += 1
+            self._admitted_since += 1
+        return True
+
+    def throttle(self, count: int):
+        if not self.enabled:
+            return
+        while self.shedding and not self._stopped.wait(self.interval):
+            pass
+        self.bucket.acquire(count)
+        with self._lock:
+            self.admitted += count
+            self._admitted_since += count
+
+    def wait_time(self):
+        return self.bucket.wait_time()
+
+    def physical_queues(self):
+        return [physical for queue in self.queues for physical in topology.physical_queues(queue)]
+
+    def record(self, physical_depths, now: float = None):
+        depths = {}
+        for queue in self.queues:
+            total = 0
+            for physical in topology.physical_queues(queue):
+                ready, unacked = physical_depths[physical]
+                total += ready + (unacked or 0)
+            depths[queue] = total
+            QUEUE_DEPTH.set(total, queue)
+        self.observe(depths, now)
+
+    def observe(self, depths, now: float = None):
+        now = time.monotonic() if now is None else now
+        entry_depth = depths[self.queues[0]]
+        with self._lock:
+            admitted, self._admitted_since = self._admitted_since, 0
+            if self._sampled_at is not None and now > self._sampled_at:
+                consumed = max(0.0, (admitted + self._entry_depth - entry_depth) / (now - self._sampled_at))
+                self.throughput = consumed if self.throughput is None else 0.7 * self.throughput + 0.3 * consumed
+            self._entry_depth = entry_depth
+            self._sampled_at = now
+
+        self.backlog = max(depths.values())
+        throughput = self.throughput or 0.0
+        if self.backlog > self.target_depth:
+            rate = throughput * self.target_depth / self.backlog
+        else:
+            rate = max(self.bucket.rate, throughput) * 1.5
+        self.bucket.set_rate(min(self.max_rate, max(self.min_rate, rate)))
+
+        shedding = self.backlog >= self.max_depth
+        if shedding != self.shedding:
+            self.shedding = shedding
+            if shedding:
+                self.log.warning(f"Admissão suspensa: {self.backlog} mensagens pendentes (limite {self.max_depth}).",
+                                 backlog=self.backlog)
+            else:
+                self.log.info(f"Admissão retomada a {self.bucket.rate:.1f} pedidos/s.", backlog=self.backlog)
+
+    def _loop(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.record({queue: self.depth(queue) for queue in self.physical_queues()})
+            except Exception as e:
+                self.log.warning(f"Falha ao medir filas: {e!r}.")
+
+    def start(self):
+        if not self.enabled or self.depth is None:
+            return
+        self._thread = threading.Thread(target=self._loop, name=f'admission-{self.service}', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            'rate': round(self.bucket.rate, 2),
+            'throughput': round(self.throughput or 0.0, 2),
+            'backlog': self.backlog,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+        }
+
+
+def create_admission_controller(service: str, depth):
+    return AdmissionController(service, depth,
+                               target_depth=settings.admission_target_depth,
+                               max_depth=settings.admission_max_depth,
+                               min_rate=settings.admission_min_rate,
+                               max_rate=settings.admission_max_rate,
+                               burst=settings.admission_burst,
+                               interval=settings.admission_interval)
@@ -0,0 +1,320 @@
+import asyncio
+import signal
+from collections import deque
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+from config import topology
+from config.rabbit_mq_config import connection_parameters
+from core.backoff import Backoff
+from core.log import get_logger
+from core.publisher import ConfirmTracker, PendingMessage
+from core.settings import settings
+from core.worker_pool import order_key
+
+
+class AsyncRuntime:
+    def __init__(self, label: str, prefetch_count: int = 10, shutdown_timeout: float = None):
+        self.label = label
+        self.log = get_logger(label)
+        self.prefetch_count = prefetch_count
+        self.shutdown_timeout = settings.drain_timeout if shutdown_timeout is None else shutdown_timeout
+        self.connection = None
+        self.channel_consumer = None
+        self.channel_publisher = None
+        self.tracker = ConfirmTracker(settings.publisher_max_retries, label)
+        self._confirmed = asyncio.Event()
+        self._window = asyncio.Semaphore(settings.publisher_confirm_window)
+        self.backoff = Backoff(settings.reconnect_base_delay, settings.reconnect_max_delay)
+        self.reconnects = 0
+        self._buffer = deque()
+        self._consumers = []
+        self._consumer_tags = []
+        self._tasks = set()
+        self._background = set()
+        self._order_locks = {}
+        self._closed = None
+        self._stopping = None
+        self._reconnecting = None
+
+    async def connect(self, parameters=None):
+        loop = asyncio.get_running_loop()
+        opened = loop.create_future()
+        self._closed = loop.create_future()
+
+        def on_open(connection):
+            opened.set_result(connection)
+
+        def on_open_error(connection, error):
+            opened.set_exception(error if isinstance(error, BaseException) else RuntimeError(error))
+
+        self.connection = AsyncioConnection(parameters or connection_parameters(),
+                                            on_open_callback=on_open,
+                                            on_open_error_callback=on_open_error,
+                                            on_close_callback=self._on_connection_closed,
+                                            custom_ioloop=loop)
+        await opened
+
+        self.channel_consumer = await self._open_channel()
+        self.channel_publisher = await self._open_channel()
+        await self._rpc(self.channel_publisher.confirm_delivery, self._on_delivery_confirmation)
+        await self._rpc(self.channel_consumer.basic_qos, prefetch_count=self.prefetch_count)
+
+    def _open_channel(self):
+        future = asyncio.get_running_loop().create_future()
+        self.connection.channel(on_open_callback=future.set_result)
+        return future
+
+    def _rpc(self, method, *args, **kwargs):
+        future = asyncio.get_running_loop().create_future()
+
+        def on_done(frame):
+            if not future.done():
+                future.set_result(frame)
+
+        method(*args, callback=on_done, **kwargs)
+        return future
+
+    def _on_connection_closed(self, connection, reason):
+        if not self._closed.done():
+            self._closed.set_result(reason)
+        if self._stopping is not None and not self._stopping.is_set():
+            self.log.warning(f"Conexão perdida: {reason}.")
+            self._buffer.extend(self.tracker.drop_pending())
+            self._reconnecting = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        while not self._stopping.is_set():
+            delay = self.backoff.next()
+            self.log.warning(f"Reconectando em {delay:.1f}s, {len(self._buffer)} mensagens retidas.",
+                             buffered=len(self._buffer))
+            try:
+                await asyncio.wait_for(self._stopping.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+
+            try:
+                await self.connect()
+                await self.setup_topology()
+                self._consumer_tags.clear()
+                for queue, on_message in self._consumers:
+                    self._basic_consume(queue, on_message)
+            except Exception as e:
+                self.log.warning(f"Falha ao reconectar: {e!r}.")
+                continue
+
+            self.backoff.reset()
+            self.reconnects += 1
+            self.log.info(f"Reconectado, {len(self._consumers)} consumidores restabelecidos, "
+                          f"reenviando {len(self._buffer)} mensagens.", buffered=len(self._buffer))
+            buffered, self._buffer = self._buffer, deque()
+            for message in buffered:
+                self._send(message)
+            return
+
+    async def exchange_declare(self, exchange: str, exchange_type: str, durable: bool = True, arguments=None):
+        await self._rpc(self.channel_consumer.exchange_declare, exchange=exchange,
+                        exchange_type=exchange_type, durable=durable, arguments=arguments)
+
+    async def exchange_bind(self, destination: str, source: str, routing_key: str):
+        await self._rpc(self.channel_consumer.exchange_bind, destination=destination,
+                        source=source, routing_key=routing_key)
+
+    async def queue_declare(self, queue: str, durable: bool = True, arguments=None):
+        frame = await self._rpc(self.channel_consumer.queue_declare, queue=queue,
+                                durable=durable, arguments=arguments)
+        return frame.method.queue
+
+    async def queue_depth(self, queue: str):
+        frame = await self._rpc(self.channel_consumer.queue_declare, queue=queue, passive=True)
+        return frame.method.message_count, None
+
+    async def queue_bind(self, exchange: str, queue: str, routing_key=None):
+        await self._rpc(self.channel_consumer.queue_bind, queue=queue,
+                        exchange=exchange, routing_key=routing_key)
+
+    async def setup_topology(self):
+        if await self._topology_present():
+            return
+
+        for exchange, exchange_type in topology.EXCHANGES.items():
+            await self.exchange_declare(exchange, exchange_type,
+                                        arguments=topology.EXCHANGE_ARGUMENTS.get(exchange))
+        for queue, arguments in topology.QUEUES.items():
+            await self.queue_declare(queue, arguments=arguments or None)
+        for exchange, queue, routing_key in topology.BINDINGS:
+            await self.queue_bind(exchange, queue, routing_key)
+        for source, destination, routing_key in topology.EXCHANGE_BINDINGS:
+            await self.exchange_bind(destination, source, routing_key)
+
+        await self.exchange_declare(topology.marker_exchange(), 'fanout')
+
+    async def _topology_present(self):
+        channel = await self._open_channel()
+        present = asyncio.get_running_loop().create_future()
+
+        def on_closed(ch, reason):
+            if not present.done():
+                present.set_result(False)
+
+        def on_declared(frame):
+            if not present.done():
+                present.set_result(True)
+
+        channel.add_on_close_callback(on_closed)
+        channel.exchange_declare(exchange=topology.marker_exchange(), passive=True, callback=on_declared)
+        result = await present
+        if channel.is_open:
+            channel.close()
+        return result
+
+    def consume(self, queue: str, callback):
+        def on_message(ch, method, properties, body):
+            self.spawn(self._handle(callback, ch, method, properties, body))
+
+        self._consumers.append((queue, on_message))
+        return self._basic_consume(queue, on_message)
+
+    def _basic_consume(self, queue: str, on_message):
+        tag = self.channel_consumer.basic_consume(queue=queue,
+                                                  on_message_callback=on_message,
+                                                  auto_ack=False)
+        self._consumer_tags.append(tag)
+        return tag
+
+    async def _handle(self, callback, ch, method, properties, body):
+        key = order_key(properties)
+        if key is None:
+            await self._dispatch(callback, ch, method, properties, body)
+            return
+
+        # Eventos do mesmo pedido rodam em sequência, na ordem de entrega (asyncio.Lock é FIFO).
+        entry = self._order_locks.get(key)
+        if entry is None:
+            entry = self._order_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._dispatch(callback, ch, method, properties, body)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._order_locks[key]
+
+    async def _dispatch(self, callback, ch, method, properties, body):
+        try:
+            result = callback(ch, method, properties, body)
+            if asyncio.iscoroutine(result):
+                await result
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.log.exception(f"Falha no handler da mensagem {method.delivery_tag}.",
+                               delivery_tag=method.delivery_tag)
+            if ch.is_open:
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+    def spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def spawn_background(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    async def publish(self, exchange: str, routing_key: str, body, headers=None, content_type=None,
+                      priority=None):
+        await self._window.acquire()
+        self._send(PendingMessage(exchange, routing_key, body, pika.BasicProperties(
+            delivery_mode=pika.DeliveryMode.Persistent,
+            content_type=content_type,
+            headers=headers,
+            priority=priority
+        )))
+
+    def _publisher_open(self):
+        return self.channel_publisher is not None and self.channel_publisher.is_open
+
+    def _send(self, message: PendingMessage):
+        self._confirmed.clear()
+        if not self._publisher_open():
+            self._buffer.append(message)
+            return
+
+        self.tracker.track(message)
+        self.channel_publisher.basic_publish(exchange=message.exchange,
+                                             routing_key=message.routing_key,
+                                             body=message.body,
+                                             properties=message.properties)
+
+    def _on_delivery_confirmation(self, frame):
+        acked, retry, failed = self.tracker.confirm(frame.method)
+        for _ in range(len(acked) + len(failed)):
+            self._window.release()
+
+        for message in retry:
+            self._send(message)
+
+        for message in failed:
+            self.log.warning(f"Broker rejeitou mensagem para {message.exchange} ({message.routing_key}) após {message.attempts} tentativas.")
+
+        if len(self.tracker) == 0 and not self._buffer:
+            self._confirmed.set()
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self, setup):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        await self.connect()
+        await setup()
+        self.log.info("Aguardando atualizações...")
+
+        await self._stopping.wait()
+        self.log.info("Encerrando.")
+        await self.shutdown()
+
+    async def shutdown(self):
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+
+        for task in self._background:
+            task.cancel()
+        if self._background:
+            await asyncio.wait(set(self._background))
+
+        if self.channel_consumer is not None and self.channel_consumer.is_open:
+            for tag in self._consumer_tags:
+                self.channel_consumer.basic_cancel(tag)
+        self._consumer_tags.clear()
+
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+        if self._buffer and not self._publisher_open():
+            self.log.warning(f"{len(self._buffer)} publicações retidas perdidas: sem conexão no encerramento.")
+            self._buffer.clear()
+
+        if len(self.tracker) > 0 and self._publisher_open():
+            try:
+                await asyncio.wait_for(self._confirmed.wait(), self.shutdown_timeout)
+            except asyncio.TimeoutError:
+                self.log.warning(f"{len(self.tracker)} publicações sem confirmação no encerramento.")
+
+        if self.connection is not None and self.connection.is_open:
+            self.connection.close()
+            await self._closed
+        self.log.info("Conexão fechada.")
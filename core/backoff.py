@@ -0,0 +1,16 @@
+import random
+
+
+class Backoff:
+    def __init__(self, base_delay: float, max_delay: float):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempts = 0
+
+    def next(self):
+        ceiling = min(self.max_delay, self.base_delay * 2 ** self.attempts)
+        self.attempts += 1
+        return random.uniform(ceiling / 2, ceiling)
+
+    def reset(self):
+        self.attempts = 0
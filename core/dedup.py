@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from config import topology
+from core.log import get_logger
+from core.metrics import MESSAGES_DEDUPLICATED
+from core.settings import settings
+from core.tracing import ORDER_ID
+
+MESSAGE_ID = 'x-message-id'
+ORDER_SEQ = 'x-order-seq'
+
+
+class DedupWindow:
+    def __init__(self, seconds: float, buckets: int = 4):
+        self.span = seconds / buckets
+        self.buckets = buckets
+        self._sets = deque([set()])
+        self._started = time.monotonic()
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._sets)
+
+    def __contains__(self, key):
+        return any(key in keys for keys in self._sets)
+
+    def add(self, key):
+        self._rotate(time.monotonic())
+        if key in self:
+            return False
+        self._sets[0].add(key)
+        return True
+
+    def _rotate(self, now: float):
+        elapsed = int((now - self._started) // self.span)
+        if elapsed <= 0:
+            return
+
+        self._started += elapsed * self.span
+        for _ in range(min(elapsed, self.buckets)):
+            self._sets.appendleft(set())
+        while len(self._sets) > self.buckets:
+            self._sets.pop()
+
+    def discard(self, key):
+        for keys in self._sets:
+            keys.discard(key)
+
+
+class DedupChannel:
+    __slots__ = ('_channel', '_release')
+
+    def __init__(self, channel, release):
+        self._channel = channel
+        self._release = release
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._release()
+        return self._channel.basic_nack(delivery_tag=delivery_tag, multiple=multiple, requeue=requeue)
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        self._release()
+        return self._channel.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+
+class Deduplicator:
+    def __init__(self, service: str, window_seconds: float = 600.0, max_orders: int = 100000):
+        self.service = service
+        self.log = get_logger(service)
+        self.window_seconds = window_seconds
+        self.max_orders = max_orders
+        self._windows = {}
+        self._versions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stamp(self, order_id: str, headers):
+        with self._lock:
+            sequence = self._versions.get(order_id, 0) + 1
+            self._remember(order_id, sequence)
+        headers[MESSAGE_ID] = uuid.uuid4().hex[:16]
+        headers[ORDER_SEQ] = sequence
+        return headers
+
+    def _remember(self, order_id: str, sequence: int):
+        self._versions[order_id] = sequence
+        self._versions.move_to_end(order_id)
+        while len(self._versions) > self.max_orders:
+            self._versions.popitem(last=False)
+
+    def _admit(self, queue: str, message_id, order_id, sequence):
+        with self._lock:
+            if sequence is not None and order_id is not None:
+                last = self._versions.get(order_id)
+                if last is not None and sequence < last:
+                    return 'stale'
+
+            if message_id is not None:
+                window = self._windows.get(queue)
+                if window is None:
+                    window = self._windows[queue] = DedupWindow(self.window_seconds)
+                if not window.add(message_id):
+                    return 'duplicate'
+
+            if sequence is not None and order_id is not None:
+                self._remember(order_id, sequence)
+            return None
+
+    def _release(self, queue: str, message_id):
+        if message_id is None:
+            return
+        with self._lock:
+            self._windows[queue].discard(message_id)
+
+    def wrap(self, queue: str, callback):
+        logical_queue = topology.logical_queue(queue)
+
+        def deduplicated(ch, method, properties, body):
+            headers = properties.headers or {}
+            message_id = headers.get(MESSAGE_ID)
+            order_id = headers.get(ORDER_ID)
+            reason = self._admit(logical_queue, message_id, order_id, headers.get(ORDER_SEQ))
+            if reason is not None:
+                MESSAGES_DEDUPLICATED.inc(self.service, queue, reason)
+                self.log.info(f"Mensagem {message_id} do pedido {order_id} descartada ({reason}).",
+                              order_id=order_id, message_id=message_id, reason=reason)
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
+
+            released = []
+
+            def release():
+                if not released:
+                    released.append(True)
+                    self._release(logical_queue, message_id)
+
+            try:
+                result = callback(DedupChannel(ch, release), method, properties, body)
+            except Exception:
+                release()
+                raise
+
+            if asyncio.iscoroutine(result):
+                return self._finish(result, release)
+
+        return deduplicated
+
+    async def _finish(self, coroutine, release):
+        try:
+            await coroutine
+        except BaseException:
+            release()
+            raise
+
+
+def create_deduplicator(service: str):
+    return Deduplicator(service, settings.dedup_window_seconds, settings.dedup_max_orders)
@@ -0,0 +1,132 @@
+import argparse
+import importlib
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from core.log import get_logger
+from core.settings import settings
+
+SERVICES = {
+    'client': ('client.src.client_service', 'ClientService', 'client_shards'),
+    'order': ('order.src.order_service', 'OrderService', 'order_shards'),
+    'delivery': ('delivery.src.delivery_service', 'DeliveryService', 'delivery_shards'),
+}
+
+
+def _per_worker(path: str, index: int):
+    root, extension = os.path.splitext(path)
+    return f'{root}_{index}{extension}'
+
+
+def _worker(service: str):
+    stopped = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stopped.set())
+
+    module, name, _ = SERVICES[service]
+    service_class = getattr(importlib.import_module(module), name)
+    service_class().serve(stopped)
+
+
+class Supervisor:
+    def __init__(self, service: str, workers: int, shutdown_timeout: float = 30.0, restart_delay: float = 1.0,
+                 max_restart_delay: float = 30.0):
+        self.service = service
+        self.workers = workers
+        self.shutdown_timeout = shutdown_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.log = get_logger(f"Supervisor {service}")
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = [None] * workers
+        self.started_at = [0.0] * workers
+        self.failures = [0] * workers
+        self.restarts = 0
+        self._stopping = threading.Event()
+
+    def _spawn(self, index: int):
+        os.environ['WORKER_INDEX'] = str(index)
+        os.environ['WORKER_COUNT'] = str(self.workers)
+        # Os workers herdam o ambiente do supervisor: cada um recebe a sua porta de métricas
+        # (METRICS_PORT + índice) e os seus arquivos de métricas e traces, com sufixo _<índice>.
+        if settings.metrics_port:
+            os.environ['METRICS_PORT'] = str(settings.metrics_port + index)
+        if settings.metrics_file:
+            os.environ['METRICS_FILE'] = _per_worker(settings.metrics_file, index)
+        if settings.trace_file and settings.trace_file != '-':
+            os.environ['TRACE_FILE'] = _per_worker(settings.trace_file, index)
+        process = self.context.Process(target=_worker, args=(self.service,),
+                                       name=f'{self.service}-{index}', daemon=False)
+        process.start()
+        self.processes[index] = process
+        self.started_at[index] = time.monotonic()
+        self.log.info(f"Worker {index} iniciado (pid {process.pid}).", worker=index, pid=process.pid)
+
+    def stop(self, *_):
+        self._stopping.set()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        shards = getattr(settings, SERVICES[self.service][2])
+        if shards and shards < self.workers:
+            self.log.warning(f"{shards} shards para {self.workers} workers: "
+                             f"{self.workers - shards} workers ficarão ociosos.")
+
+        for index in range(self.workers):
+            self._spawn(index)
+
+        restart_at = [None] * self.workers
+        while not self._stopping.wait(0.5):
+            now = time.monotonic()
+            for index, process in enumerate(self.processes):
+                if process.is_alive():
+                    continue
+
+                if restart_at[index] is None:
+                    if now - self.started_at[index] > self.max_restart_delay:
+                        self.failures[index] = 0
+                    delay = min(self.restart_delay * 2 ** self.failures[index], self.max_restart_delay)
+                    self.failures[index] += 1
+                    restart_at[index] = now + delay
+                    self.log.warning(f"Worker {index} terminou com código {process.exitcode}, "
+                                     f"reiniciando em {delay:.0f}s.", worker=index, exitcode=process.exitcode)
+                elif now >= restart_at[index]:
+                    restart_at[index] = None
+                    self.restarts += 1
+                    self._spawn(index)
+
+        self.shutdown()
+
+    def shutdown(self):
+        self.log.info(f"Encerrando {self.workers} workers.")
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        for index, process in enumerate(self.processes):
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                self.log.warning(f"Worker {index} não encerrou em {self.shutdown_timeout}s, forçando.", worker=index)
+                process.kill()
+                process.join()
+
+        self.log.info("Workers encerrados.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Roda N workers de um serviço como consumidores concorrentes.')
+    parser.add_argument('service', choices=sorted(SERVICES))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--shutdown-timeout', type=float, default=settings.drain_timeout + 10.0)
+    args = parser.parse_args()
+
+    Supervisor(args.service, args.workers, args.shutdown_timeout).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+from client.src.client_service import ClientService
+from core.settings import settings
+from delivery.src.delivery_service import DeliveryService
+from order.src.order_service import OrderService
+
+
+def main():
+    settings.transport = 'memory'
+
+    services = [OrderService(), DeliveryService()]
+    for service in services:
+        service.start()
+
+    try:
+        ClientService().run()
+    finally:
+        for service in services:
+            service.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from core.settings import settings
+
+LOGGER_NAME = 'delivery_q'
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'service': record.service,
+            'message': record.getMessage(),
+        }
+        entry.update(record.fields)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"[{record.service}] {record.getMessage()}"
+        suppressed = record.fields.get('suppressed')
+        if suppressed:
+            line += f" ({suppressed} linhas suprimidas)"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class StdoutHandler(logging.StreamHandler):
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+class InProcessQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        return record
+
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.suppressed = 0
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if self.rate <= 0:
+            return True, 0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                self.suppressed += 1
+                return False, 0
+
+            self._tokens -= 1
+            suppressed, self.suppressed = self.suppressed, 0
+            return True, suppressed
+
+
+class ServiceLogger:
+    def __init__(self, service: str, logger: logging.Logger):
+        self.service = service
+        self.logger = logger
+        self.status_sample_rate = settings.log_status_sample_rate
+        self.status_limiter = RateLimiter(settings.log_status_rate_limit)
+
+    def info(self, message: str, **fields):
+        self._emit(logging.INFO, message, fields)
+
+    def warning(self, message: str, **fields):
+        self._emit(logging.WARNING, message, fields)
+
+    def error(self, message: str, **fields):
+        self._emit(logging.ERROR, message, fields)
+
+    def exception(self, message: str, **fields):
+        self._emit(logging.ERROR, message, fields, exc_info=True)
+
+    def status(self, order_id: str, status: str, **fields):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+        if self.status_sample_rate < 1 and random.random() >= self.status_sample_rate:
+            return
+
+        allowed, suppressed = self.status_limiter.allow()
+        if not allowed:
+            return
+        if suppressed:
+            fields['suppressed'] = suppressed
+
+        self._emit(logging.INFO, f"Pedido {order_id} {status}.", dict(fields, order_id=order_id, status=status))
+
+    def _emit(self, level: int, message: str, fields, exc_info=False):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, exc_info=exc_info, extra={'service': self.service, 'fields': fields})
+
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def _configure():
+    global _listener
+    with _configure_lock:
+        logger = logging.getLogger(LOGGER_NAME)
+        if _listener is not None:
+            return logger
+
+        handler = StdoutHandler()
+        handler.setFormatter(JsonFormatter() if settings.log_format == 'json' else TextFormatter())
+
+        records = queue.SimpleQueue()
+        _listener = logging.handlers.QueueListener(records, handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        logger.addHandler(InProcessQueueHandler(records))
+        logger.setLevel(settings.log_level.upper())
+        logger.propagate = False
+        return logger
+
+
+def get_logger(service: str):
+    return ServiceLogger(service, _configure())
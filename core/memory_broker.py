@@ -0,0 +1,545 @@
+import functools
+import heapq
+import itertools
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+import pika
+from pika.spec import Basic
+from config import topology
+from core.metrics import PUBLISHED
+from core.worker_pool import create_worker_pool, guard
+
+
+class MemoryMessage:
+    __slots__ = ('exchange', 'routing_key', 'body', 'properties', 'redelivered', 'expires_at')
+
+    def __init__(self, exchange: str, routing_key: str, body, properties):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties or pika.BasicProperties()
+        self.redelivered = False
+        self.expires_at = None
+
+
+class PriorityMessages:
+    def __init__(self, max_priority: int = 0):
+        self.max_priority = max_priority
+        self.levels = [deque() for _ in range(max_priority + 1)]
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _level(self, message: MemoryMessage):
+        priority = message.properties.priority or 0
+        return self.levels[min(max(priority, 0), self.max_priority)]
+
+    def append(self, message: MemoryMessage):
+        self._level(message).append(message)
+        self._size += 1
+
+    def appendleft(self, message: MemoryMessage):
+        self._level(message).appendleft(message)
+        self._size += 1
+
+    def popleft(self):
+        for level in reversed(self.levels):
+            if level:
+                self._size -= 1
+                return level.popleft()
+        raise IndexError('pop from an empty queue')
+
+    def pop_expired(self, now: float):
+        expired = []
+        for level in self.levels:
+            while level and level[0].expires_at is not None and level[0].expires_at <= now:
+                expired.append(level.popleft())
+        self._size -= len(expired)
+        return expired
+
+
+class MemoryQueue:
+    def __init__(self, name: str, durable: bool = True, arguments=None):
+        self.name = name
+        self.durable = durable
+        self.arguments = arguments or {}
+        self.ttl = self.arguments.get('x-message-ttl')
+        self.messages = PriorityMessages(self.arguments.get('x-max-priority', 0))
+        self.consumers = deque()
+        self.unacked = 0
+
+
+class MemoryBroker:
+    def __init__(self):
+        self.exchanges = {'': 'direct'}
+        self.queues = {}
+        self.bindings = {}
+        self.exchange_arguments = {}
+        self.exchange_bindings = {}
+        self.published = 0
+        self.delivered = 0
+        self.acked = 0
+        self.dead_lettered = Counter()
+        self.unroutable = 0
+        self._patterns = {}
+        self._expirations = []
+        self._sequence = itertools.count()
+        self._expiry_thread = None
+        self._closed = False
+        self.lock = threading.RLock()
+        self._expiry_due = threading.Condition(self.lock)
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'direct', durable: bool = True,
+                         passive: bool = False, arguments=None):
+        with self.lock:
+            if exchange not in self.exchanges:
+                if passive:
+                    raise pika.exceptions.ChannelClosedByBroker(404, f"NOT_FOUND - no exchange '{exchange}'")
+                self.exchanges[exchange] = exchange_type
+                self.exchange_arguments[exchange] = arguments or {}
+                self.bindings[exchange] = []
+                self.exchange_bindings[exchange] = []
+
+    def exchange_bind(self, destination: str, source: str, routing_key: str):
+        with self.lock:
+            binding = (destination, routing_key)
+            if binding not in self.exchange_bindings[source]:
+                self.exchange_bindings[source].append(binding)
+
+    def queue_declare(self, queue: str, durable: bool = True, arguments=None):
+        with self.lock:
+            if queue not in self.queues:
+                self.queues[queue] = MemoryQueue(queue, durable, arguments)
+
+    def queue_bind(self, exchange: str, queue: str, routing_key: str):
+        with self.lock:
+            binding = (queue, routing_key)
+            if binding not in self.bindings[exchange]:
+                self.bindings[exchange].append(binding)
+
+    def declare_topology(self):
+        for exchange, exchange_type in topology.EXCHANGES.items():
+            self.exchange_declare(exchange, exchange_type, arguments=topology.EXCHANGE_ARGUMENTS.get(exchange))
+        for queue, arguments in topology.QUEUES.items():
+            self.queue_declare(queue, arguments=arguments)
+        for exchange, queue, routing_key in topology.BINDINGS:
+            self.queue_bind(exchange, queue, routing_key)
+        for source, destination, routing_key in topology.EXCHANGE_BINDINGS:
+            self.exchange_bind(destination, source, routing_key)
+
+    def publish(self, exchange: str, routing_key: str, body, properties=None):
+        with self.lock:
+            self.published += 1
+            self._route(MemoryMessage(exchange, routing_key, body, properties))
+
+    def _route(self, message: MemoryMessage):
+        queues = self._match(message.exchange, message.routing_key, message.properties.headers)
+        if not queues:
+            self.unroutable += 1
+            return
+
+        for name in queues:
+            queue = self.queues[name]
+            if len(queues) > 1:
+                message = MemoryMessage(message.exchange, message.routing_key, message.body, message.properties)
+            if queue.ttl is not None:
+                message.expires_at = time.monotonic() + queue.ttl / 1000
+                self._schedule_expiry(message.expires_at, name)
+            queue.messages.append(message)
+            self._dispatch(queue)
+
+    def _match(self, exchange: str, routing_key: str, headers=None):
+        if exchange == '':
+            return [routing_key] if routing_key in self.queues else []
+
+        exchange_type = self.exchanges[exchange]
+        if exchange_type == topology.CONSISTENT_HASH:
+            return self._hash_match(exchange, routing_key, headers)
+
+        matched = []
+        for destination, binding_key in self.bindings[exchange] + self.exchange_bindings[exchange]:
+            if exchange_type == 'fanout':
+                hit = True
+            elif exchange_type == 'topic':
+                hit = self._topic_pattern(binding_key).match(routing_key) is not None
+            else:
+                hit = binding_key == routing_key
+            if not hit:
+                continue
+
+            if destination in self.exchanges:
+                targets = self._match(destination, routing_key, headers)
+            else:
+                targets = [destination]
+            matched.extend(queue for queue in targets if queue not in matched)
+        return matched
+
+    def _hash_match(self, exchange: str, routing_key: str, headers=None):
+        bindings = self.bindings[exchange]
+        header = self.exchange_arguments[exchange].get('hash-header')
+        key = (headers or {}).get(header) if header else routing_key
+        if not bindings or key is None:
+            return []
+
+        weights = [int(weight) for _, weight in bindings]
+        point = zlib.crc32(str(key).encode()) % sum(weights)
+        for (queue, _), weight in zip(bindings, weights):
+            if point < weight:
+                return [queue]
+            point -= weight
+        return []
+
+    def _topic_pattern(self, binding_key: str):
+        pattern = self._patterns.get(binding_key)
+        if pattern is None:
+            words = []
+            for word in binding_key.split('.'):
+                if word == '*':
+                    words.append(r'[^.]+')
+                elif word == '#':
+                    words.append(r'.*')
+                else:
+                    words.append(re.escape(word))
+            pattern = self._patterns[binding_key] = re.compile(r'\.'.join(words) + r'\Z')
+        return pattern
+
+    def consume(self, channel, queue: str, callback):
+        with self.lock:
+            consumer_tag = f'ctag-{id(channel)}-{queue}'
+            self.queues[queue].consumers.append((channel, consumer_tag, callback))
+            self._dispatch(self.queues[queue])
+            return consumer_tag
+
+    def cancel(self, channel):
+        with self.lock:
+            for queue in self.queues.values():
+                queue.consumers = deque(c for c in queue.consumers if c[0] is not channel)
+
+    def _schedule_expiry(self, expires_at: float, queue: str):
+        heapq.heappush(self._expirations, (expires_at, next(self._sequence), queue))
+        if self._expiry_thread is None:
+            self._expiry_thread = threading.Thread(target=self._expiry_loop, name='memory-broker-ttl', daemon=True)
+            self._expiry_thread.start()
+        self._expiry_due.notify()
+
+    def _expiry_loop(self):
+        with self.lock:
+            while not self._closed:
+                if not self._expirations:
+                    self._expiry_due.wait()
+                    continue
+
+                delay = self._expirations[0][0] - time.monotonic()
+                if delay > 0:
+                    self._expiry_due.wait(delay)
+                    continue
+
+                _, _, queue = heapq.heappop(self._expirations)
+                self._expire(self.queues[queue])
+
+    def _expire(self, queue: MemoryQueue):
+        for message in queue.messages.pop_expired(time.monotonic()):
+            self._dead_letter(queue.name, message, 'expired')
+
+    def close(self):
+        with self.lock:
+            self._closed = True
+            self._expiry_due.notify_all()
+
+    def _dispatch(self, queue: MemoryQueue):
+        self._expire(queue)
+        skipped = 0
+        while queue.messages and queue.consumers and skipped < len(queue.consumers):
+            channel, consumer_tag, callback = queue.consumers[0]
+            queue.consumers.rotate(-1)
+            if not channel.has_capacity():
+                skipped += 1
+                continue
+
+            skipped = 0
+            message = queue.messages.popleft()
+            queue.unacked += 1
+            self.delivered += 1
+            channel.deliver(queue.name, consumer_tag, callback, message)
+
+    def _release(self, channel, queue: str):
+        self._dispatch(self.queues[queue])
+        for name in channel.queues:
+            if name != queue and self.queues[name].messages:
+                self._dispatch(self.queues[name])
+
+    def ack(self, channel, queue: str):
+        with self.lock:
+            self.acked += 1
+            self.queues[queue].unacked -= 1
+            self._release(channel, queue)
+
+    def reject(self, channel, queue: str, message: MemoryMessage, requeue: bool):
+        with self.lock:
+            self.queues[queue].unacked -= 1
+            if requeue:
+                message.redelivered = True
+                self.queues[queue].messages.appendleft(message)
+            else:
+                self._dead_letter(queue, message, 'rejected')
+            self._release(channel, queue)
+
+    def _dead_letter(self, queue: str, message: MemoryMessage, reason: str):
+        arguments = self.queues[queue].arguments
+        exchange = arguments.get('x-dead-letter-exchange')
+        self.dead_lettered[(queue, reason)] += 1
+        if exchange is None:
+            return
+
+        routing_key = arguments.get('x-dead-letter-routing-key', message.routing_key)
+        headers = dict(message.properties.headers or {})
+        deaths = [dict(entry) for entry in headers.get('x-death') or []]
+        for entry in deaths:
+            if entry.get('queue') == queue and entry.get('reason') == reason:
+                entry['count'] = int(entry.get('count', 1)) + 1
+                deaths.remove(entry)
+                deaths.insert(0, entry)
+                break
+        else:
+            deaths.insert(0, {'queue': queue, 'reason': reason, 'count': 1,
+                              'exchange': message.exchange, 'routing-keys': [message.routing_key]})
+        headers['x-death'] = deaths
+
+        properties = pika.BasicProperties(delivery_mode=message.properties.delivery_mode,
+                                          content_type=message.properties.content_type,
+                                          headers=headers,
+                                          priority=message.properties.priority)
+        self._route(MemoryMessage(exchange, routing_key, message.body, properties))
+
+    def queue_depth(self, queue: str):
+        with self.lock:
+            queue = self.queues[queue]
+            return len(queue.messages), queue.unacked
+
+    def stats(self):
+        with self.lock:
+            return {
+                'published': self.published,
+                'delivered': self.delivered,
+                'acked': self.acked,
+                'rejected': sum(n for (_, reason), n in self.dead_lettered.items() if reason == 'rejected'),
+                'expired': sum(n for (_, reason), n in self.dead_lettered.items() if reason == 'expired'),
+                'unroutable': self.unroutable,
+                'ready': {name: len(queue.messages) for name, queue in self.queues.items() if queue.messages},
+            }
+
+
+class MemoryConnection:
+    def __init__(self):
+        self.is_open = True
+        self._callbacks = deque()
+        self._timers = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+
+    @property
+    def is_closed(self):
+        return not self.is_open
+
+    def add_callback_threadsafe(self, callback):
+        with self._wakeup:
+            self._callbacks.append(callback)
+            self._wakeup.notify()
+
+    def call_later(self, delay: float, callback):
+        timer = [time.monotonic() + delay, next(self._sequence), callback]
+        with self._wakeup:
+            heapq.heappush(self._timers, timer)
+            self._wakeup.notify()
+        return timer
+
+    def remove_timeout(self, timer):
+        timer[2] = None
+
+    def process_data_events(self, time_limit: float = 0):
+        with self._wakeup:
+            if not self._callbacks:
+                timeout = time_limit
+                if self._timers:
+                    timeout = max(0.0, min(timeout, self._timers[0][0] - time.monotonic()))
+                self._wakeup.wait(timeout)
+
+            ready = list(self._callbacks)
+            self._callbacks.clear()
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                callback = heapq.heappop(self._timers)[2]
+                if callback is not None:
+                    ready.append(callback)
+
+        for callback in ready:
+            callback()
+
+    def close(self):
+        self.is_open = False
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+
+class MemoryChannel:
+    def __init__(self, broker: MemoryBroker, connection: MemoryConnection):
+        self.broker = broker
+        self.connection = connection
+        self.prefetch_count = 0
+        self.is_open = True
+        self.queues = []
+        self._consuming = False
+        self._cancelled = False
+        self._unacked = {}
+        self._delivery_tag = itertools.count(1)
+
+    def basic_qos(self, prefetch_count: int = 0):
+        self.prefetch_count = prefetch_count
+
+    def has_capacity(self):
+        return self.is_open and (self.prefetch_count == 0 or len(self._unacked) < self.prefetch_count)
+
+    def basic_consume(self, queue: str, on_message_callback, auto_ack: bool = False):
+        self.queues.append(queue)
+        return self.broker.consume(self, queue, on_message_callback)
+
+    def deliver(self, queue: str, consumer_tag: str, callback, message: MemoryMessage):
+        delivery_tag = next(self._delivery_tag)
+        self._unacked[delivery_tag] = (queue, message)
+        method = Basic.Deliver(consumer_tag=consumer_tag,
+                               delivery_tag=delivery_tag,
+                               redelivered=message.redelivered,
+                               exchange=message.exchange,
+                               routing_key=message.routing_key)
+        self.connection.add_callback_threadsafe(
+            functools.partial(self._handle, callback, method, message.properties, message.body))
+
+    def _handle(self, callback, method, properties, body):
+        if self._cancelled:
+            self.basic_reject(method.delivery_tag, requeue=True)
+            return
+        callback(self, method, properties, body)
+
+    def _settle(self, delivery_tag: int, multiple: bool):
+        if multiple:
+            tags = [tag for tag in self._unacked if tag <= delivery_tag]
+        else:
+            tags = [delivery_tag]
+        return [(tag, self._unacked.pop(tag)) for tag in tags if tag in self._unacked]
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        with self.broker.lock:
+            for _, (queue, _) in self._settle(delivery_tag, multiple):
+                self.broker.ack(self, queue)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        with self.broker.lock:
+            for _, (queue, message) in self._settle(delivery_tag, multiple):
+                self.broker.reject(self, queue, message, requeue)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self.basic_nack(delivery_tag, requeue=requeue)
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.connection.is_open:
+            self.connection.process_data_events(time_limit=1.0)
+
+    def stop_consuming(self):
+        self._consuming = False
+        with self.broker.lock:
+            self._cancelled = True
+            self.broker.cancel(self)
+
+    def close(self):
+        with self.broker.lock:
+            self.is_open = False
+            self.broker.cancel(self)
+            for _, (queue, message) in sorted(self._unacked.items(), reverse=True):
+                self.broker.reject(self, queue, message, requeue=True)
+            self._unacked.clear()
+
+
+class MemoryPublisher:
+    def __init__(self):
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+
+
+class MemoryRabbit:
+    def __init__(self, broker: MemoryBroker, label: str, prefetch_count: int = 10, worker_pool_size: int = 0):
+        self.broker = broker
+        self.label = label
+
+        self.connection = MemoryConnection()
+        self.channel = MemoryChannel(broker, self.connection)
+        self.setup_topology()
+        self.channel.basic_qos(prefetch_count=prefetch_count)
+        self.publisher = MemoryPublisher()
+
+        self.worker_pool = create_worker_pool(worker_pool_size, label, prefetch_count)
+
+    def setup_topology(self):
+        self.broker.declare_topology()
+
+    def on_reconnect(self, callback):
+        pass
+
+    def consume(self, queue: str, callback):
+        if self.worker_pool is not None:
+            callback = self.worker_pool.wrap(callback)
+        else:
+            callback = guard(callback, self.label)
+
+        return self.channel.basic_consume(queue=queue, on_message_callback=callback, auto_ack=False)
+
+    def publish(self, exchange: str, routing_key: str, body, headers=None, content_type=None, priority=None):
+        properties = pika.BasicProperties(delivery_mode=pika.DeliveryMode.Persistent,
+                                          content_type=content_type,
+                                          headers=headers,
+                                          priority=priority)
+        self.broker.publish(exchange, routing_key, body, properties)
+        PUBLISHED.inc(self.label)
+
+    def publish_batch(self, exchange: str, routing_key: str, messages, content_type=None, priority=None):
+        total = 0
+        for body, headers in messages:
+            self.publish(exchange, routing_key, body, headers=headers, content_type=content_type,
+                         priority=priority)
+            total += 1
+        return total
+
+    def flush(self, timeout: float = None):
+        return True
+
+    def queue_depth(self, queue: str):
+        return self.broker.queue_depth(queue)
+
+    def start_consuming(self):
+        self.channel.start_consuming()
+
+    def stop_consuming(self):
+        if self.channel.is_open:
+            self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
+    def _busy(self, busy):
+        if self.worker_pool is not None and self.worker_pool.in_flight:
+            return True
+        return busy is not None and busy()
+
+    def drain(self, deadline: float, busy=None):
+        while time.monotonic() < deadline and self.connection.is_open and self._busy(busy):
+            self.connection.process_data_events(time_limit=0.1)
+
+        self.connection.process_data_events(time_limit=0)
+
+    def close(self):
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown(wait=False)
+
+        self.channel.close()
+        self.connection.close()
@@ -0,0 +1,335 @@
+import asyncio
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from core.log import get_logger
+from core.settings import settings
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, _format_labels(self.labels, key), value) for key, value in values]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        super().__init__(name, documentation, labels)
+        self._functions = {}
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, function, *labels):
+        with self._lock:
+            self._functions[labels] = function
+
+    def samples(self):
+        samples = super().samples()
+        with self._lock:
+            functions = list(self._functions.items())
+        samples += [(self.name, _format_labels(self.labels, key), function()) for key, function in functions]
+        return samples
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', _format_labels(self.labels, key, [('le', bound)]), cumulative))
+            samples.append((f'{self.name}_sum', _format_labels(self.labels, key), total))
+            samples.append((f'{self.name}_count', _format_labels(self.labels, key), cumulative))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labels=()):
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels=()):
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=DURATION_BUCKETS):
+        return self._register(Histogram, name, documentation, labels, buckets)
+
+    def exposition(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+MESSAGES_CONSUMED = REGISTRY.counter('delivery_q_messages_consumed_total', 'Mensagens entregues ao handler.',
+                                     ('service', 'queue'))
+MESSAGES_ACKED = REGISTRY.counter('delivery_q_messages_acked_total', 'Mensagens confirmadas com basic_ack.',
+                                  ('service', 'queue'))
+MESSAGES_NACKED = REGISTRY.counter('delivery_q_messages_nacked_total', 'Mensagens rejeitadas com basic_nack/reject.',
+                                   ('service', 'queue'))
+HANDLER_ERRORS = REGISTRY.counter('delivery_q_handler_errors_total', 'Exceções lançadas pelo handler.',
+                                  ('service', 'queue'))
+HANDLER_DURATION = REGISTRY.histogram('delivery_q_handler_duration_seconds', 'Duração do handler.',
+                                      ('service', 'queue'))
+IN_FLIGHT = REGISTRY.gauge('delivery_q_messages_in_flight', 'Mensagens em processamento.', ('service',))
+ORDERS_TRACKED = REGISTRY.gauge('delivery_q_orders_tracked', 'Pedidos em memória no serviço.', ('service',))
+ORDERS_TERMINAL = REGISTRY.gauge('delivery_q_orders_terminal', 'Pedidos em status terminal aguardando despejo.',
+                                 ('service',))
+ORDERS_EVICTED = REGISTRY.gauge('delivery_q_orders_evicted', 'Pedidos despejados do armazenamento.', ('service',))
+ORDER_STORE_PENDING = REGISTRY.gauge('delivery_q_order_store_pending', 'Mudanças ainda não gravadas no SQLite.',
+                                     ('service',))
+ORDER_STORE_COMMITS = REGISTRY.gauge('delivery_q_order_store_commits', 'Transações gravadas no SQLite.',
+                                     ('service',))
+PUBLISHED = REGISTRY.counter('delivery_q_published_total', 'Mensagens publicadas.', ('publisher',))
+CONFIRMED = REGISTRY.counter('delivery_q_publish_confirms_total', 'Confirmações de publicação do broker.',
+                             ('publisher', 'result'))
+CONFIRM_LATENCY = REGISTRY.histogram('delivery_q_publish_confirm_seconds', 'Tempo entre publicação e confirmação.',
+                                     ('publisher',))
+MESSAGES_DEDUPLICATED = REGISTRY.counter('delivery_q_messages_deduplicated_total',
+                                        'Mensagens descartadas como duplicadas ou fora de ordem.',
+                                        ('service', 'queue', 'reason'))
+QUEUE_DEPTH = REGISTRY.gauge('delivery_q_queue_depth', 'Mensagens prontas e sem ack na fila, somando os shards.',
+                             ('queue',))
+ADMISSION_RATE = REGISTRY.gauge('delivery_q_admission_rate', 'Taxa de admissão de pedidos novos (pedidos/s).',
+                                ('service',))
+ADMISSION_REJECTED = REGISTRY.counter('delivery_q_admission_rejected_total',
+                                      'Pedidos novos recusados pelo controle de admissão.',
+                                      ('service', 'reason'))
+COURIERS_BUSY = REGISTRY.gauge('delivery_q_couriers_busy', 'Entregadores em rota.', ('service',))
+DISPATCH_WAITING = REGISTRY.gauge('delivery_q_dispatch_waiting', 'Pedidos confirmados aguardando entregador.',
+                                  ('service',))
+ORDERS_DELIVERED = REGISTRY.counter('delivery_q_orders_delivered_total', 'Pedidos entregues pelos entregadores.',
+                                    ('service',))
+DLQ_REPUBLISHED = REGISTRY.counter('delivery_q_dlq_republished_total', 'Mensagens reencaminhadas a partir da DLQ.',
+                                   ('queue', 'outcome'))
+
+ORDER_STORE_GAUGES = {
+    'terminal': ORDERS_TERMINAL,
+    'evicted': ORDERS_EVICTED,
+    'pending': ORDER_STORE_PENDING,
+    'commits': ORDER_STORE_COMMITS,
+}
+
+
+class CountingChannel:
+    __slots__ = ('_channel', '_labels')
+
+    def __init__(self, channel, labels):
+        self._channel = channel
+        self._labels = labels
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        MESSAGES_ACKED.inc(*self._labels)
+        return self._channel.basic_ack(delivery_tag=delivery_tag, multiple=multiple)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        MESSAGES_NACKED.inc(*self._labels)
+        return self._channel.basic_nack(delivery_tag=delivery_tag, multiple=multiple, requeue=requeue)
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        MESSAGES_NACKED.inc(*self._labels)
+        return self._channel.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+
+ORDER_STORES = {}
+
+
+def query_orders(query):
+    service = query.get('service', [''])[0]
+    limit = int(query.get('limit', ['100'])[0])
+    stores = {name: orders for name, orders in list(ORDER_STORES.items()) if service in name}
+
+    if 'status' in query:
+        status = query['status'][0]
+        return {name: orders.by_status(status, limit) for name, orders in stores.items()}
+    if 'recent' in query:
+        return {name: orders.recent(limit) for name, orders in stores.items()}
+    return {name: orders.counts() for name, orders in stores.items()}
+
+
+class ServiceMetrics:
+    def __init__(self, service: str, orders=None):
+        self.service = service
+        if orders is not None:
+            ORDERS_TRACKED.set_function(orders.__len__, service)
+            for key in orders.stats().keys() & ORDER_STORE_GAUGES.keys():
+                ORDER_STORE_GAUGES[key].set_function(lambda key=key: orders.stats()[key], service)
+            ORDER_STORES[service] = orders
+
+    def wrap(self, queue: str, callback):
+        labels = (self.service, queue)
+
+        def measured(ch, method, properties, body):
+            MESSAGES_CONSUMED.inc(*labels)
+            IN_FLIGHT.inc(self.service)
+            started = time.perf_counter()
+            try:
+                result = callback(CountingChannel(ch, labels), method, properties, body)
+            except Exception:
+                self._finish(labels, started, failed=True)
+                raise
+
+            if asyncio.iscoroutine(result):
+                return self._finish_async(result, labels, started)
+            self._finish(labels, started)
+
+        return measured
+
+    async def _finish_async(self, coroutine, labels, started: float):
+        try:
+            await coroutine
+        except BaseException:
+            self._finish(labels, started, failed=True)
+            raise
+        self._finish(labels, started)
+
+    def _finish(self, labels, started: float, failed: bool = False):
+        HANDLER_DURATION.observe(time.perf_counter() - started, *labels)
+        IN_FLIGHT.dec(self.service)
+        if failed:
+            HANDLER_ERRORS.inc(*labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/orders':
+            try:
+                result = query_orders(parse_qs(url.query))
+            except ValueError:
+                self.send_error(400)
+                return
+            self._reply(json.dumps(result, ensure_ascii=False).encode(), 'application/json; charset=utf-8')
+            return
+
+        if url.path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        self._reply(REGISTRY.exposition().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+
+    def _reply(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def write_metrics_file(path: str):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write(REGISTRY.exposition())
+    os.replace(temporary, path)
+
+
+def _file_loop(path: str, interval: float):
+    while True:
+        time.sleep(interval)
+        write_metrics_file(path)
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter():
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+
+    if settings.metrics_port:
+        server = ThreadingHTTPServer((settings.metrics_host, settings.metrics_port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        get_logger('Métricas').info(f"Servindo em http://{settings.metrics_host}:{settings.metrics_port}/metrics",
+                                    host=settings.metrics_host, port=settings.metrics_port)
+
+    if settings.metrics_file:
+        threading.Thread(target=_file_loop, args=(settings.metrics_file, settings.metrics_interval),
+                         name='metrics-file', daemon=True).start()
+
+
+def create_service_metrics(service: str, orders=None):
+    start_exporter()
+    return ServiceMetrics(service, orders)
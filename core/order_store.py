@@ -0,0 +1,266 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from client.src.simple_order import SimpleOrder
+from core.settings import settings
+
+TERMINAL_STATUSES = ("RECEBIDO", "FINALIZADO")
+STATUS_ORDER = ("CRIADO", "ENVIADO", "CONFIRMADO", "EM ROTA", "ENTREGUE", "RECEBIDO", "FINALIZADO")
+_STAGES = {status: stage for stage, status in enumerate(STATUS_ORDER)}
+
+
+def is_behind(status: str, current: str):
+    if status not in _STAGES or current not in _STAGES:
+        return False
+    return _STAGES[status] < _STAGES[current]
+
+
+class OrderRecord:
+    __slots__ = ('order_id', 'product', 'quantity', 'unit_price', 'status', 'updated_at')
+
+    def __init__(self, order_id: str, product: str, quantity: int, unit_price: float, status: str):
+        self.order_id = order_id
+        self.product = product
+        self.quantity = quantity
+        self.unit_price = unit_price
+        self.status = status
+        self.updated_at = time.monotonic()
+
+    @classmethod
+    def from_order(cls, order: SimpleOrder):
+        return cls(order.order_id, order.product, order.quantity, order.unit_price, order.status)
+
+    def to_order(self):
+        return SimpleOrder.model_construct(order_id=self.order_id,
+                                           product=self.product,
+                                           quantity=self.quantity,
+                                           unit_price=self.unit_price,
+                                           status=self.status)
+
+
+def _describe(record: OrderRecord, now: float):
+    return {
+        'order_id': record.order_id,
+        'status': record.status,
+        'seconds_in_status': round(now - record.updated_at, 3),
+    }
+
+
+class OrderStore:
+    def __init__(self, terminal_statuses=TERMINAL_STATUSES, retention_seconds: float = 600.0,
+                 max_terminal: int = 10000):
+        self.terminal_statuses = frozenset(terminal_statuses)
+        self.retention_seconds = retention_seconds
+        self.max_terminal = max_terminal
+        self.evicted = 0
+        self._records = {}
+        self._terminal = OrderedDict()
+        self._by_status = {}
+        self._transitions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, order_id: str):
+        return order_id in self._records
+
+    def get(self, order_id: str):
+        record = self._records.get(order_id)
+        if record is None:
+            return None
+        return record.to_order()
+
+    def status(self, order_id: str):
+        record = self._records.get(order_id)
+        if record is None:
+            return None
+        return record.status
+
+    def track(self, order: SimpleOrder):
+        with self._lock:
+            if order.order_id not in self._records:
+                record = self._records[order.order_id] = OrderRecord.from_order(order)
+                self._index(record)
+                self._mark(record)
+                self._on_change(record)
+            self._evict()
+
+    def update_status(self, order_id: str, new_status: str):
+        with self._lock:
+            record = self._records.get(order_id)
+            if record is None or is_behind(new_status, record.status):
+                return False
+            previous = record.status
+            record.status = new_status
+            record.updated_at = time.monotonic()
+            self._index(record, previous)
+            self._mark(record)
+            self._on_change(record)
+            self._evict()
+            return True
+
+    def _index(self, record: OrderRecord, previous: str = None):
+        if previous is not None:
+            self._unindex(record.order_id, previous)
+        self._by_status.setdefault(record.status, OrderedDict())[record.order_id] = record
+        self._transitions[record.order_id] = record
+        self._transitions.move_to_end(record.order_id)
+
+    def _unindex(self, order_id: str, status: str):
+        orders = self._by_status[status]
+        del orders[order_id]
+        if not orders:
+            del self._by_status[status]
+
+    def _mark(self, record: OrderRecord):
+        if record.status in self.terminal_statuses:
+            self._terminal[record.order_id] = record.updated_at
+            self._terminal.move_to_end(record.order_id)
+        else:
+            self._terminal.pop(record.order_id, None)
+
+    def _evict(self):
+        deadline = time.monotonic() - self.retention_seconds
+        while self._terminal:
+            order_id, finished_at = next(iter(self._terminal.items()))
+            if len(self._terminal) <= self.max_terminal and finished_at > deadline:
+                break
+            self._terminal.popitem(last=False)
+            record = self._records.pop(order_id)
+            self._unindex(order_id, record.status)
+            del self._transitions[order_id]
+            self._on_evict(order_id)
+            self.evicted += 1
+
+    def _on_change(self, record: OrderRecord):
+        pass
+
+    def _on_evict(self, order_id: str):
+        pass
+
+    def counts(self):
+        with self._lock:
+            return {status: len(orders) for status, orders in self._by_status.items()}
+
+    def by_status(self, status: str, limit: int = 100):
+        now = time.monotonic()
+        with self._lock:
+            orders = self._by_status.get(status) or {}
+            return [_describe(record, now) for record in itertools.islice(orders.values(), limit)]
+
+    def recent(self, limit: int = 100):
+        now = time.monotonic()
+        with self._lock:
+            records = itertools.islice(reversed(self._transitions.values()), limit)
+            return [_describe(record, now) for record in records]
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {
+            'size': len(self._records),
+            'terminal': len(self._terminal),
+            'evicted': self.evicted,
+        }
+
+
+class PersistentOrderStore(OrderStore):
+    def __init__(self, path: str, terminal_statuses=TERMINAL_STATUSES, retention_seconds: float = 600.0,
+                 max_terminal: int = 10000, flush_interval: float = 0.05):
+        super().__init__(terminal_statuses, retention_seconds, max_terminal)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.commits = 0
+        self.flushed = 0
+        self._dirty = {}
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS orders ('
+                         'order_id TEXT PRIMARY KEY, product TEXT, quantity INTEGER, '
+                         'unit_price REAL, status TEXT, updated_at REAL)')
+        self._load()
+
+        self._thread = threading.Thread(target=self._flush_loop, name=f'order-store-{path}', daemon=True)
+        self._thread.start()
+
+    def _load(self):
+        wall_now = time.time()
+        monotonic_now = time.monotonic()
+        rows = self._db.execute('SELECT order_id, product, quantity, unit_price, status, updated_at '
+                                'FROM orders ORDER BY updated_at').fetchall()
+
+        with self._lock:
+            for order_id, product, quantity, unit_price, status, updated_at in rows:
+                record = OrderRecord(order_id, product, quantity, unit_price, status)
+                record.updated_at = monotonic_now - (wall_now - updated_at)
+                self._records[order_id] = record
+                self._index(record)
+                self._mark(record)
+            self._evict()
+
+    def _on_change(self, record: OrderRecord):
+        self._dirty[record.order_id] = (record.order_id, record.product, record.quantity,
+                                        record.unit_price, record.status, time.time())
+
+    def _on_evict(self, order_id: str):
+        self._dirty[order_id] = None
+
+    def _flush_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+            if not batch:
+                return
+
+            upserts = [row for row in batch.values() if row is not None]
+            deletes = [(order_id,) for order_id, row in batch.items() if row is None]
+
+            self._db.execute('BEGIN')
+            self._db.executemany('INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?)', upserts)
+            self._db.executemany('DELETE FROM orders WHERE order_id = ?', deletes)
+            self._db.execute('COMMIT')
+            self.commits += 1
+            self.flushed += len(batch)
+
+    def stats(self):
+        stats = super().stats()
+        stats['commits'] = self.commits
+        stats['flushed'] = self.flushed
+        stats['pending'] = len(self._dirty)
+        return stats
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self.flush()
+        self._db.close()
+
+
+def create_order_store(name: str, terminal_statuses=TERMINAL_STATUSES):
+    if settings.worker_count > 1:
+        name = f'{name}_{settings.worker_index}'
+
+    if settings.order_store_dir:
+        os.makedirs(settings.order_store_dir, exist_ok=True)
+        return PersistentOrderStore(os.path.join(settings.order_store_dir, f'{name}.sqlite3'),
+                                    terminal_statuses,
+                                    retention_seconds=settings.order_store_retention_seconds,
+                                    max_terminal=settings.order_store_max_terminal,
+                                    flush_interval=settings.order_store_flush_interval_ms / 1000)
+
+    return OrderStore(terminal_statuses,
+                      retention_seconds=settings.order_store_retention_seconds,
+                      max_terminal=settings.order_store_max_terminal)
@@ -0,0 +1,347 @@
+import functools
+import itertools
+import threading
+import time
+from collections import deque
+import pika
+from pika.spec import Basic
+from core.backoff import Backoff
+from core.log import get_logger
+from core.metrics import CONFIRM_LATENCY, CONFIRMED, PUBLISHED
+from core.settings import settings
+
+
+class PendingMessage:
+    __slots__ = ('exchange', 'routing_key', 'body', 'properties', 'attempts', 'published_at')
+
+    def __init__(self, exchange: str, routing_key: str, body, properties):
+        self.exchange = exchange
+        self.routing_key = routing_key
+        self.body = body
+        self.properties = properties
+        self.attempts = 1
+        self.published_at = None
+
+
+class ConfirmTracker:
+    def __init__(self, max_retries: int = 3, label: str = ''):
+        self.max_retries = max_retries
+        self.label = label
+        self.published = 0
+        self.acked = 0
+        self.nacked = 0
+        self.retried = 0
+        self.failed = 0
+        self._pending = {}
+        self._delivery_tag = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def track(self, message: PendingMessage):
+        self._delivery_tag += 1
+        self._pending[self._delivery_tag] = message
+        message.published_at = time.perf_counter()
+        self.published += 1
+        PUBLISHED.inc(self.label)
+        return self._delivery_tag
+
+    def confirm(self, method):
+        if method.multiple:
+            tags = list(itertools.takewhile(lambda tag: tag <= method.delivery_tag, self._pending))
+        else:
+            tags = [method.delivery_tag]
+
+        acked, retry, failed = [], [], []
+        now = time.perf_counter()
+        for tag in tags:
+            message = self._pending.pop(tag, None)
+            if message is None:
+                continue
+
+            CONFIRM_LATENCY.observe(now - message.published_at, self.label)
+            if isinstance(method, Basic.Ack):
+                self.acked += 1
+                acked.append(message)
+            elif message.attempts <= self.max_retries:
+                self.nacked += 1
+                self.retried += 1
+                message.attempts += 1
+                retry.append(message)
+            else:
+                self.nacked += 1
+                self.failed += 1
+                failed.append(message)
+
+        if acked:
+            CONFIRMED.inc(self.label, 'ack', amount=len(acked))
+        if retry or failed:
+            CONFIRMED.inc(self.label, 'nack', amount=len(retry) + len(failed))
+        return acked, retry, failed
+
+    def drop_pending(self):
+        messages = list(self._pending.values())
+        self._pending.clear()
+        self._delivery_tag = 0
+        return messages
+
+
+class ConfirmedPublisher:
+    def __init__(self, parameters, label: str, window_size: int = 256, max_retries: int = 3):
+        self.parameters = parameters
+        self.label = label
+        self.log = get_logger(label)
+        self.window_size = window_size
+        self.tracker = ConfirmTracker(max_retries, label)
+        self._window = threading.BoundedSemaphore(window_size)
+        self._idle = threading.Condition()
+        self._outstanding = 0
+        self._ready = threading.Event()
+        self._unblocked = threading.Event()
+        self._unblocked.set()
+        self.blocked = 0
+        self.blocked_seconds = 0.0
+        self.reconnects = 0
+        self.backoff = Backoff(settings.reconnect_base_delay, settings.reconnect_max_delay)
+        self._buffer = deque()
+        self._error = None
+        self._closing = False
+        self._connection = None
+        self._ioloop = None
+        self._channel = None
+        self._thread = None
+
+    def start(self, timeout: float = 30.0):
+        self._connect()
+        self._thread = threading.Thread(target=self._ioloop.start,
+                                        name=f'publisher-{self.label}', daemon=True)
+        self._thread.start()
+
+        if not self._ready.wait(timeout):
+            raise pika.exceptions.AMQPConnectionError(f'Publisher {self.label} não conectou em {timeout}s.')
+        if self._error is not None:
+            raise self._error
+
+    def publish(self, exchange: str, routing_key: str, body, headers=None, content_type=None, properties=None,
+                priority=None):
+        self._check_open()
+
+        if properties is None:
+            properties = self._properties(headers, content_type, priority)
+
+        self._wait_unblocked()
+        self._window.acquire()
+        with self._idle:
+            self._outstanding += 1
+
+        message = PendingMessage(exchange, routing_key, body, properties)
+        self._ioloop.add_callback_threadsafe(functools.partial(self._send, message))
+
+    def publish_batch(self, exchange: str, routing_key: str, messages, content_type=None, priority=None):
+        self._check_open()
+
+        batch = []
+        total = 0
+        for body, headers in messages:
+            if not self._unblocked.is_set() or not self._window.acquire(blocking=False):
+                self._dispatch(batch)
+                batch = []
+                self._wait_unblocked()
+                self._window.acquire()
+            batch.append(PendingMessage(exchange, routing_key, body, self._properties(headers, content_type, priority)))
+            total += 1
+        self._dispatch(batch)
+        return total
+
+    def _check_open(self):
+        if self._error is not None or self._closing:
+            raise pika.exceptions.AMQPConnectionError(f'Publisher {self.label} fechado.')
+
+    def _properties(self, headers, content_type, priority=None):
+        return pika.BasicProperties(
+            delivery_mode=pika.DeliveryMode.Persistent,
+            content_type=content_type,
+            headers=headers,
+            priority=priority
+        )
+
+    def _wait_unblocked(self):
+        if self._unblocked.is_set():
+            return
+
+        started = time.monotonic()
+        while not self._unblocked.wait(1.0):
+            self._check_open()
+        self.blocked_seconds += time.monotonic() - started
+
+    def _dispatch(self, batch):
+        if not batch:
+            return
+
+        with self._idle:
+            self._outstanding += len(batch)
+        self._ioloop.add_callback_threadsafe(functools.partial(self._send_batch, batch))
+
+    def flush(self, timeout: float = None):
+        with self._idle:
+            return self._idle.wait_for(lambda: self._outstanding == 0, timeout)
+
+    def close(self, timeout: float = 30.0):
+        if self._connection is None:
+            return
+
+        if not self.flush(timeout):
+            self.log.warning(f"{self._outstanding} publicações sem confirmação no encerramento.")
+
+        self._closing = True
+        self._ioloop.add_callback_threadsafe(self._shutdown)
+        self._thread.join(timeout)
+
+    def _connect(self):
+        if self._closing:
+            self._stop()
+            return
+
+        self._connection = pika.SelectConnection(self.parameters,
+                                                 on_open_callback=self._on_connection_open,
+                                                 on_open_error_callback=self._on_connection_open_error,
+                                                 on_close_callback=self._on_connection_closed,
+                                                 custom_ioloop=self._ioloop)
+        self._ioloop = self._connection.ioloop
+        self._connection.add_on_connection_blocked_callback(self._on_connection_blocked)
+        self._connection.add_on_connection_unblocked_callback(self._on_connection_unblocked)
+
+    def _reconnect(self):
+        delay = self.backoff.next()
+        self.log.warning(f"Reconectando publicador em {delay:.1f}s, "
+                         f"{len(self._buffer)} mensagens retidas.", buffered=len(self._buffer))
+        self._ioloop.call_later(delay, self._connect)
+
+    def _shutdown(self):
+        if self._connection.is_closed:
+            self._stop()
+        elif not self._connection.is_closing:
+            self._connection.close()
+
+    def _stop(self):
+        self._unblocked.set()
+        self.tracker.drop_pending()
+        self._buffer.clear()
+        self._settle(self._outstanding)
+        self._ioloop.stop()
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error):
+        if not self._ready.is_set():
+            self._error = error if isinstance(error, Exception) else pika.exceptions.AMQPConnectionError(error)
+            self._ready.set()
+            self._stop()
+        elif self._closing:
+            self._stop()
+        else:
+            self.log.warning(f"Falha ao reconectar publicador: {error}.")
+            self._reconnect()
+
+    def _on_connection_closed(self, connection, reason):
+        self._channel = None
+        self._unblocked.set()
+        if self._closing:
+            self._stop()
+            return
+
+        self.log.warning(f"Conexão de publicação perdida: {reason}.")
+        self._retain(self.tracker.drop_pending())
+        self._reconnect()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.confirm_delivery(self._on_delivery_confirmation,
+                                 callback=self._on_confirm_selected)
+
+    def _on_confirm_selected(self, frame):
+        if self._ready.is_set():
+            self.reconnects += 1
+            self.log.info(f"Publicador reconectado, reenviando {len(self._buffer)} mensagens.",
+                          buffered=len(self._buffer))
+        self.backoff.reset()
+        self._ready.set()
+
+        buffered, self._buffer = self._buffer, deque()
+        for message in buffered:
+            self._send(message)
+
+    def _on_channel_closed(self, channel, reason):
+        if self._channel is not channel:
+            return
+
+        self._channel = None
+        if self._closing or not self._connection.is_open:
+            return
+
+        self.log.warning(f"Canal de publicação fechado: {reason}. Reabrindo.")
+        self._retain(self.tracker.drop_pending(), count_attempt=True)
+        self._connection.channel(on_open_callback=self._on_channel_open)
+
+    def _retain(self, messages, count_attempt: bool = False):
+        failed = 0
+        for message in messages:
+            if count_attempt:
+                message.attempts += 1
+                if message.attempts > self.tracker.max_retries + 1:
+                    self.log.warning(f"Mensagem para {message.exchange} ({message.routing_key}) "
+                                     f"descartada após {message.attempts - 1} tentativas.")
+                    failed += 1
+                    continue
+            self._buffer.append(message)
+        self.tracker.failed += failed
+        self._settle(failed)
+
+    def _on_connection_blocked(self, connection, frame):
+        self.blocked += 1
+        self._unblocked.clear()
+        self.log.warning(f"Broker bloqueou publicações: {frame.method.reason}. Aguardando.")
+
+    def _on_connection_unblocked(self, connection, frame):
+        self._unblocked.set()
+        self.log.info("Broker liberou publicações.")
+
+    def _send_batch(self, batch):
+        for message in batch:
+            self._send(message)
+
+    def _send(self, message: PendingMessage):
+        if self._channel is None or not self._channel.is_open:
+            self._buffer.append(message)
+            return
+
+        self.tracker.track(message)
+        self._channel.basic_publish(exchange=message.exchange,
+                                    routing_key=message.routing_key,
+                                    body=message.body,
+                                    properties=message.properties)
+
+    def _on_delivery_confirmation(self, frame):
+        acked, retry, failed = self.tracker.confirm(frame.method)
+
+        for message in retry:
+            self._send(message)
+
+        for message in failed:
+            self.log.warning(f"Broker rejeitou mensagem para {message.exchange} ({message.routing_key}) após {message.attempts} tentativas.")
+
+        self._settle(len(acked) + len(failed))
+
+    def _settle(self, count: int):
+        if count == 0:
+            return
+
+        for _ in range(count):
+            self._window.release()
+
+        with self._idle:
+            self._outstanding -= count
+            if self._outstanding == 0:
+                self._idle.notify_all()
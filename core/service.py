@@ -0,0 +1,98 @@
+import asyncio
+import uuid
+from client.src.order_codec import get_codec
+from client.src.simple_order import SimpleOrder
+from config import topology
+from core.aio_runtime import AsyncRuntime
+from core.dedup import create_deduplicator
+from core.log import get_logger
+from core.metrics import create_service_metrics
+from core.order_store import create_order_store
+from core.settings import settings
+from core.tracing import create_tracer
+from core.transport import create_transport
+
+
+class Service:
+    def __init__(self, name: str, store_name: str, terminal_statuses, order_store=None, transport=None,
+                 prefetch_count: int = 10, worker_pool_size: int = 0):
+        self.service_id = str(uuid.uuid4())[:8]
+        self.label = f"{name} {self.service_id}"
+        self.codec = get_codec(settings.message_codec)
+        self.log = get_logger(self.label)
+        self.tracer = create_tracer(self.label)
+        self.dedup = create_deduplicator(self.label)
+        self.orders = order_store if order_store is not None else create_order_store(store_name, terminal_statuses)
+        self.metrics = create_service_metrics(self.label, self.orders)
+        self.prefetch_count = prefetch_count
+        self.worker_pool_size = worker_pool_size
+
+        self.connect(transport)
+
+        self._consume_thread = None
+        self.log.info("Serviço iniciado.")
+
+    def consumers(self):
+        return []
+
+    def connect(self, transport):
+        transport = transport or create_transport
+        self.rabbit = self.transport = transport(self.label,
+                                                 prefetch_count=self.prefetch_count,
+                                                 worker_pool_size=self.worker_pool_size)
+        self.register_consumers()
+
+    def register_consumers(self):
+        for logical_queue, callback in self.consumers():
+            for queue in topology.consumer_queues(logical_queue):
+                self.consume_wrapped(queue, callback)
+
+    def consume_wrapped(self, queue: str, callback):
+        # Cada tentativa chega à DLQ com o mesmo x-message-id: deduplicar ali perderia os reenvios.
+        handler = callback if topology.is_dead_queue(queue) else self.dedup.wrap(queue, callback)
+        self.transport.consume(queue, self.metrics.wrap(queue, self.tracer.wrap(queue, handler)))
+
+    def order_message(self, order: SimpleOrder):
+        headers = self.dedup.stamp(order.order_id, self.tracer.headers_for(order.order_id))
+        return self.codec.encode(order), self.tracer.stamp(headers)
+
+    def _send(self, exchange: str, routing_key: str, body, headers=None, content_type=None, priority=None):
+        self.transport.publish(exchange, routing_key, body, headers=headers,
+                               content_type=content_type, priority=priority)
+
+    def _publish(self, exchange: str, routing_key: str, body, headers=None, content_type=None, priority=None):
+        self._send(exchange, routing_key, body, headers=self.tracer.stamp(headers),
+                   content_type=content_type, priority=priority)
+
+    def _publish_order(self, exchange: str, routing_key: str, order: SimpleOrder):
+        body, headers = self.order_message(order)
+        self._send(exchange, routing_key, body, headers=headers,
+                   content_type=self.codec.content_type, priority=topology.priority(order.status))
+
+    def update_order_status(self, order_id: str, new_status: str):
+        return self.orders.update_status(order_id, new_status)
+
+    def print_order_status(self, order_id: str):
+        status = self.orders.status(order_id)
+        if status is not None:
+            self.log.status(order_id, status)
+
+
+class AsyncService:
+    def connect(self, transport):
+        self.runtime = self.transport = AsyncRuntime(self.label, prefetch_count=self.prefetch_count)
+
+    async def setup(self):
+        await self.runtime.setup_topology()
+        self.register_consumers()
+
+    def _send(self, exchange: str, routing_key: str, body, headers=None, content_type=None, priority=None):
+        self.runtime.spawn(self.runtime.publish(exchange, routing_key, body, headers=headers,
+                                                content_type=content_type, priority=priority))
+
+    def run(self):
+        try:
+            asyncio.run(self.runtime.run(self.setup))
+        finally:
+            self.orders.close()
+            self.tracer.close()
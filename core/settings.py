@@ -7,7 +7,67 @@ class Settings(BaseSettings):
     rabbitmq_port: str
     rabbitmq_vhost: str
 
+    transport: str = 'rabbitmq'
+
+    client_prefetch_count: int = 10
+    client_worker_pool_size: int = 0
+    order_prefetch_count: int = 10
+    order_worker_pool_size: int = 0
+    delivery_prefetch_count: int = 50
+    delivery_worker_pool_size: int = 0
+    worker_pool_mode: str = 'keyed'
+    worker_lane_capacity: int = 0
+    delivery_couriers: int = 10
+    delivery_courier_capacity: int = 5
+    delivery_batch_window: float = 5.0
+
+    client_order_interval: float = 0.0
+    admission_target_depth: int = 500
+    admission_max_depth: int = 2000
+    admission_min_rate: float = 1.0
+    admission_max_rate: float = 1000.0
+    admission_burst: float = 50.0
+    admission_interval: float = 1.0
+    admission_wait_timeout: float = 5.0
+    drain_timeout: float = 20.0
+
+    worker_index: int = 0
+    worker_count: int = 1
+    order_shards: int = 0
+    delivery_shards: int = 0
+    client_shards: int = 0
+    queue_max_priority: int = 5
+    client_bulk_batch_size: int = 500
+    simulated_delay_scale: float = 1.0
+    trace_file: str = ''
+    metrics_host: str = '127.0.0.1'
+    metrics_port: int = 0
+    metrics_file: str = ''
+    metrics_interval: float = 15.0
+
+    log_format: str = 'text'
+    log_level: str = 'INFO'
+    log_status_sample_rate: float = 1.0
+    log_status_rate_limit: float = 0.0
+
+    publisher_confirm_window: int = 256
+    publisher_max_retries: int = 3
+    reconnect_base_delay: float = 0.5
+    reconnect_max_delay: float = 30.0
+    message_codec: str = 'json'
+
+    dedup_window_seconds: float = 600.0
+    dedup_max_orders: int = 100000
+
+    retry_max_attempts: int = 3
+    retry_base_delay_ms: int = 5000
+
+    order_store_retention_seconds: float = 600.0
+    order_store_max_terminal: int = 10000
+    order_store_dir: str = ''
+    order_store_flush_interval_ms: int = 50
+
     class Config:
         env_file = '.env'
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
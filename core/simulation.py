@@ -0,0 +1,6 @@
+import random
+from core.settings import settings
+
+
+def simulated_delay(low: int, high: int):
+    return random.randint(low, high) * settings.simulated_delay_scale
@@ -0,0 +1,160 @@
+import asyncio
+import atexit
+import json
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from config.topology import SHARD_KEY_HEADER
+from core.settings import settings
+
+TRACE_ID = 'x-trace-id'
+ORDER_ID = SHARD_KEY_HEADER
+HOP = 'x-trace-hop'
+PUBLISHED_AT = 'x-published-at'
+PUBLISHER = 'x-publisher'
+
+
+class SpanWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if path == '-':
+            self._file = sys.stdout
+        else:
+            self._file = open(path, 'a', encoding='utf-8', buffering=1 << 16)
+
+    def write(self, span: dict):
+        line = json.dumps(span, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            if self._file is not sys.stdout:
+                self._file.close()
+
+
+class Tracer:
+    def __init__(self, service: str, writer: SpanWriter = None, max_traces: int = 10000):
+        self.service = service
+        self.writer = writer
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.writer is not None
+
+    def headers_for(self, order_id: str):
+        if not self.enabled:
+            return {ORDER_ID: order_id}
+
+        with self._lock:
+            trace = self._traces.get(order_id)
+            if trace is None:
+                trace = (uuid.uuid4().hex[:16], 0)
+                self._remember(order_id, *trace)
+        trace_id, hop = trace
+
+        headers = {TRACE_ID: trace_id, ORDER_ID: order_id}
+        if hop:
+            headers[HOP] = hop
+        return headers
+
+    def stamp(self, headers):
+        if not self.enabled or not headers or TRACE_ID not in headers:
+            return headers
+
+        headers = dict(headers)
+        headers[HOP] = int(headers.get(HOP, 0)) + 1
+        headers[PUBLISHED_AT] = time.time()
+        headers[PUBLISHER] = self.service
+        return headers
+
+    def _remember(self, order_id: str, trace_id: str, hop: int):
+        self._traces[order_id] = (trace_id, hop)
+        self._traces.move_to_end(order_id)
+        while len(self._traces) > self.max_traces:
+            self._traces.popitem(last=False)
+
+    def wrap(self, queue: str, callback):
+        if not self.enabled:
+            return callback
+
+        def traced(ch, method, properties, body):
+            headers = properties.headers or {}
+            if TRACE_ID not in headers:
+                return callback(ch, method, properties, body)
+
+            if ORDER_ID in headers:
+                with self._lock:
+                    self._remember(headers[ORDER_ID], headers[TRACE_ID], int(headers.get(HOP, 0)))
+
+            received_at = time.time()
+            started = time.perf_counter()
+            try:
+                result = callback(ch, method, properties, body)
+            except Exception:
+                self._record(queue, headers, received_at, started, 'error')
+                raise
+
+            if asyncio.iscoroutine(result):
+                return self._finish(result, queue, headers, received_at, started)
+            self._record(queue, headers, received_at, started, 'ok')
+
+        return traced
+
+    async def _finish(self, coroutine, queue: str, headers, received_at: float, started: float):
+        try:
+            await coroutine
+        except Exception:
+            self._record(queue, headers, received_at, started, 'error')
+            raise
+        self._record(queue, headers, received_at, started, 'ok')
+
+    def _record(self, queue: str, headers, received_at: float, started: float, outcome: str):
+        published_at = headers.get(PUBLISHED_AT)
+        self.writer.write({
+            'trace_id': headers[TRACE_ID],
+            'order_id': headers.get(ORDER_ID),
+            'service': self.service,
+            'queue': queue,
+            'hop': headers.get(HOP, 0),
+            'publisher': headers.get(PUBLISHER),
+            'published_at': published_at,
+            'received_at': received_at,
+            'queue_wait_ms': round((received_at - published_at) * 1000, 3) if published_at else None,
+            'handler_ms': round((time.perf_counter() - started) * 1000, 3),
+            'outcome': outcome,
+        })
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _writer(path: str):
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = SpanWriter(path)
+            atexit.register(writer.close)
+        return writer
+
+
+def create_tracer(service: str):
+    if not settings.trace_file:
+        return Tracer(service)
+    return Tracer(service, _writer(settings.trace_file))
@@ -0,0 +1,23 @@
+import threading
+from config.rabbit_mq_config import RabbitMQConfig
+from core.memory_broker import MemoryBroker, MemoryRabbit
+from core.settings import settings
+
+_memory_broker = None
+_memory_broker_lock = threading.Lock()
+
+
+def memory_broker():
+    global _memory_broker
+    with _memory_broker_lock:
+        if _memory_broker is None:
+            _memory_broker = MemoryBroker()
+        return _memory_broker
+
+
+def create_transport(label: str, prefetch_count: int = 10, worker_pool_size: int = 0):
+    if settings.transport == 'memory':
+        return MemoryRabbit(memory_broker(), label, prefetch_count, worker_pool_size)
+    if settings.transport == 'rabbitmq':
+        return RabbitMQConfig(label, prefetch_count, worker_pool_size)
+    raise ValueError(f"Transporte desconhecido: {settings.transport}")
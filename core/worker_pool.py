@@ -0,0 +1,163 @@
+import functools
+import queue
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from config.topology import SHARD_KEY_HEADER
+from core.log import get_logger
+from core.settings import settings
+
+
+def order_key(properties):
+    return (properties.headers or {}).get(SHARD_KEY_HEADER)
+
+
+class ThreadsafeChannel:
+    def __init__(self, channel):
+        self._channel = channel
+        self._connection = channel.connection
+
+    def _call(self, method, **kwargs):
+        if self._connection.is_closed:
+            return
+
+        def call():
+            if self._channel.is_open:
+                method(**kwargs)
+        self._connection.add_callback_threadsafe(call)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self._call(self._channel.basic_ack, delivery_tag=delivery_tag, multiple=multiple)
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        self._call(self._channel.basic_nack, delivery_tag=delivery_tag, multiple=multiple, requeue=requeue)
+
+    def basic_reject(self, delivery_tag=0, requeue=True):
+        self._call(self._channel.basic_reject, delivery_tag=delivery_tag, requeue=requeue)
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+
+def run_handler(log, callback, ch, method, properties, body):
+    try:
+        callback(ch, method, properties, body)
+    except Exception:
+        log.exception(f"Falha no handler da mensagem {method.delivery_tag}.",
+                      delivery_tag=method.delivery_tag)
+        if ch.is_open:
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+
+def guard(callback, name: str):
+    return functools.partial(run_handler, get_logger(name), callback)
+
+
+class WorkerPool:
+    def __init__(self, max_workers: int, name: str = 'worker'):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix=name)
+        self.log = get_logger(name)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def wrap(self, callback):
+        def on_message(ch, method, properties, body):
+            with self._lock:
+                self.in_flight += 1
+            self.executor.submit(self._run, callback, ch, method, properties, body)
+        return on_message
+
+    def _run(self, callback, ch, method, properties, body):
+        try:
+            run_handler(self.log, callback, ThreadsafeChannel(ch), method, properties, body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class KeyedWorkerPool(WorkerPool):
+    def __init__(self, lanes: int, name: str = 'worker', prefetch_count: int = 10, lane_capacity: int = 0):
+        self.lanes = [queue.Queue(maxsize=lane_capacity) for _ in range(lanes)]
+        self.prefetch_count = prefetch_count
+        self.lane_capacity = lane_capacity
+        self.consumers = 0
+        self.log = get_logger(name)
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._lane, args=(lane,), name=f'{name}-lane-{index}',
+                                          daemon=True)
+                         for index, lane in enumerate(self.lanes)]
+        for thread in self._threads:
+            thread.start()
+
+    def lane_for(self, method, properties):
+        key = order_key(properties)
+        if key is None:
+            return self.lanes[method.delivery_tag % len(self.lanes)]
+        return self.lanes[zlib.crc32(str(key).encode()) % len(self.lanes)]
+
+    def wrap(self, callback):
+        # O prefetch vale por consumidor: no pior caso todas as mensagens entregues caem na mesma fila.
+        self.consumers += 1
+        if not self.lane_capacity:
+            for lane in self.lanes:
+                lane.maxsize = self.prefetch_count * self.consumers
+
+        def on_message(ch, method, properties, body):
+            if self._stopped:
+                return
+            with self._lock:
+                self.in_flight += 1
+            try:
+                self.lane_for(method, properties).put_nowait((callback, ch, method, properties, body))
+            except queue.Full:
+                with self._lock:
+                    self.in_flight -= 1
+                self.log.warning(f"Fila de execução cheia, mensagem {method.delivery_tag} devolvida ao broker.",
+                                 delivery_tag=method.delivery_tag)
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        return on_message
+
+    def _lane(self, lane: queue.Queue):
+        while True:
+            task = lane.get()
+            if task is None:
+                return
+            self._run(*task)
+
+    def shutdown(self, wait: bool = True):
+        self._stopped = True
+        for lane in self.lanes:
+            if not wait:
+                self._discard(lane)
+            lane.put(None)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _discard(self, lane: queue.Queue):
+        dropped = 0
+        while True:
+            try:
+                lane.get_nowait()
+            except queue.Empty:
+                break
+            dropped += 1
+        with self._lock:
+            self.in_flight -= dropped
+
+
+def create_worker_pool(size: int, name: str, prefetch_count: int):
+    if size <= 0:
+        return None
+    if settings.worker_pool_mode != 'keyed':
+        return WorkerPool(size, name=name)
+
+    return KeyedWorkerPool(size, name=name, prefetch_count=prefetch_count,
+                           lane_capacity=settings.worker_lane_capacity)
@@ -0,0 +1,35 @@
+import asyncio
+from client.src.simple_order import SimpleOrder
+from core.service import AsyncService
+from core.simulation import simulated_delay
+from delivery.src.delivery_service import DeliveryService
+
+class AsyncDeliveryService(AsyncService, DeliveryService):
+    def send_delivery(self, order: SimpleOrder, ack):
+        if order.status not in ("CONFIRMADO", "EM ROTA"):
+            self.log.info(f"Pedido {order.order_id} não confirmado.", order_id=order.order_id)
+            ack()
+            return
+
+        self.runtime.spawn(self.deliver(order.order_id, order.status, ack))
+
+    async def deliver(self, order_id: str, status: str, ack):
+        acked = False
+        try:
+            if status == "CONFIRMADO":
+                await asyncio.sleep(simulated_delay(3, 15))
+                self.publish_delivery_status(order_id, "EM ROTA")
+            ack()
+            acked = True
+
+            await asyncio.sleep(simulated_delay(15, 25))
+            self.publish_delivery_status(order_id, "ENTREGUE")
+        except asyncio.CancelledError:
+            self.hand_off(order_id)
+            if not acked:
+                ack()
+            raise
+
+if __name__ == '__main__':
+    svc = AsyncDeliveryService()
+    svc.run()
@@ -0,0 +1,185 @@
+import itertools
+import threading
+import time
+from collections import deque
+from core.metrics import COURIERS_BUSY, DISPATCH_WAITING, ORDERS_DELIVERED
+from core.settings import settings
+from core.simulation import simulated_delay
+
+WINDOW = 'JANELA'
+
+
+class Courier:
+    __slots__ = ('courier_id', 'route', 'busy_since', 'busy_seconds', 'routes', 'delivered')
+
+    def __init__(self, courier_id: int):
+        self.courier_id = courier_id
+        self.route = None
+        self.busy_since = None
+        self.busy_seconds = 0.0
+        self.routes = 0
+        self.delivered = 0
+
+
+class Route:
+    __slots__ = ('route_id', 'courier', 'orders')
+
+    def __init__(self, route_id: str, courier: Courier, orders):
+        self.route_id = route_id
+        self.courier = courier
+        self.orders = orders
+
+
+class CourierDispatcher:
+    def __init__(self, service: str, schedule, publish, couriers: int = 10, capacity: int = 5,
+                 window: float = 5.0):
+        self.service = service
+        self.schedule = schedule
+        self.publish = publish
+        self.capacity = capacity
+        self.window = window
+        self.couriers = [Courier(index) for index in range(couriers)]
+        self.routes = 0
+        self.delivered = 0
+        self._idle = deque(self.couriers)
+        self._batch = []
+        self._batch_id = None
+        self._ready = deque()
+        self._routes = {}
+        self._assigned = set()
+        self._acks = {}
+        self._sequence = itertools.count(1)
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+        COURIERS_BUSY.set_function(lambda: len(self.couriers) - len(self._idle), service)
+        DISPATCH_WAITING.set_function(self.waiting, service)
+
+    def submit(self, order_id: str, status: str, ack=None):
+        acks = []
+        with self._lock:
+            if order_id in self._assigned:
+                return False
+            self._assigned.add(order_id)
+            if ack is not None:
+                self._acks[order_id] = ack
+
+            self._batch.append((order_id, status))
+            if len(self._batch) >= self.capacity:
+                self._close_batch()
+                acks = self._dispatch()
+            elif len(self._batch) == 1:
+                self._batch_id = f'janela-{next(self._sequence)}'
+                self.schedule(self.window * settings.simulated_delay_scale, self._batch_id, WINDOW)
+
+        for ack in acks:
+            ack()
+        return True
+
+    def on_due(self, key: str, event: str):
+        acks = []
+        order_ids = []
+        with self._lock:
+            if event == WINDOW:
+                if key == self._batch_id:
+                    self._close_batch()
+                    acks = self._dispatch()
+            else:
+                acks, order_ids = self._advance(key, event)
+
+        for ack in acks:
+            ack()
+        if order_ids:
+            self.publish(order_ids, event)
+
+    def _advance(self, key: str, event: str):
+        route = self._routes.get(key)
+        if route is None:
+            return [], []
+
+        if event == "EM ROTA":
+            stops = len(route.orders) - 1
+            self.schedule(simulated_delay(15, 25) + simulated_delay(1, 3) * stops, key, "ENTREGUE")
+            return [], [order_id for order_id, status in route.orders if status == "CONFIRMADO"]
+
+        order_ids = [order_id for order_id, _ in route.orders]
+        self._finish(route)
+        return self._dispatch(), order_ids
+
+    def _close_batch(self):
+        if self._batch:
+            self._ready.append(self._batch)
+        self._batch = []
+        self._batch_id = None
+
+    def _dispatch(self):
+        now = time.monotonic()
+        acks = []
+        while self._idle and self._ready:
+            courier = self._idle.popleft()
+            route = Route(f'rota-{next(self._sequence)}', courier, self._ready.popleft())
+            courier.route = route
+            courier.busy_since = now
+            self._routes[route.route_id] = route
+            self.schedule(simulated_delay(3, 15), route.route_id, "EM ROTA")
+            acks += [self._acks.pop(order_id) for order_id, _ in route.orders if order_id in self._acks]
+        return acks
+
+    def _release(self, courier: Courier):
+        courier.busy_seconds += time.monotonic() - courier.busy_since
+        courier.route = None
+        courier.busy_since = None
+        self._idle.append(courier)
+
+    def _finish(self, route: Route):
+        courier = route.courier
+        courier.routes += 1
+        courier.delivered += len(route.orders)
+        self._release(courier)
+
+        del self._routes[route.route_id]
+        for order_id, _ in route.orders:
+            self._assigned.discard(order_id)
+        self.routes += 1
+        self.delivered += len(route.orders)
+        ORDERS_DELIVERED.inc(self.service, amount=len(route.orders))
+
+    def pending(self):
+        return len(self._assigned)
+
+    def waiting(self):
+        with self._lock:
+            return self._waiting()
+
+    def _waiting(self):
+        return len(self._batch) + sum(len(batch) for batch in self._ready)
+
+    def drain(self):
+        with self._lock:
+            batches = [route.orders for route in self._routes.values()] + list(self._ready) + [self._batch]
+            for route in self._routes.values():
+                self._release(route.courier)
+            self._routes.clear()
+            self._ready.clear()
+            self._batch = []
+            self._batch_id = None
+            self._assigned.clear()
+            acks = list(self._acks.values())
+            self._acks.clear()
+        return [order_id for batch in batches for order_id, _ in batch], acks
+
+    def stats(self):
+        now = time.monotonic()
+        elapsed = max(now - self._started, 1e-9)
+        with self._lock:
+            busy_seconds = sum(courier.busy_seconds + (now - courier.busy_since if courier.route else 0.0)
+                               for courier in self.couriers)
+            return {
+                'couriers': len(self.couriers),
+                'busy': len(self.couriers) - len(self._idle),
+                'waiting': self._waiting(),
+                'routes': self.routes,
+                'delivered': self.delivered,
+                'orders_per_route': round(self.delivered / self.routes, 2) if self.routes else 0.0,
+                'throughput': round(self.delivered / elapsed, 2),
+                'utilization': round(busy_seconds / (len(self.couriers) * elapsed), 4) if self.couriers else 0.0,
+            }
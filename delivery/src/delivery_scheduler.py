@@ -0,0 +1,78 @@
+import functools
+import heapq
+import itertools
+import threading
+import time
+
+
+class DeliveryScheduler:
+    def __init__(self, connection, on_due):
+        self.connection = connection
+        self.on_due = on_due
+        self._heap = []
+        self._sequence = itertools.count()
+        self._timer = None
+        self._timer_due = None
+        self._deferred = []
+        self._lock = threading.Lock()
+
+    def schedule(self, delay: float, order_id: str, status: str):
+        due = time.monotonic() + delay
+        push = functools.partial(self._push, due, order_id, status)
+        with self._lock:
+            if self.connection.is_closed:
+                self._deferred.append(push)
+                return
+            self.connection.add_callback_threadsafe(push)
+
+    def attach(self, connection):
+        with self._lock:
+            self.connection = connection
+            deferred, self._deferred = self._deferred, []
+
+        self._timer = None
+        self._timer_due = None
+        for push in deferred:
+            push()
+        self._arm()
+
+    def _push(self, due: float, order_id: str, status: str):
+        heapq.heappush(self._heap, (due, next(self._sequence), order_id, status))
+        self._arm()
+
+    def pending(self):
+        return len(self._heap)
+
+    def drain(self):
+        if self._timer is not None:
+            self.connection.remove_timeout(self._timer)
+            self._timer = None
+            self._timer_due = None
+
+        entries = [(order_id, status) for _, _, order_id, status in sorted(self._heap)]
+        self._heap.clear()
+        return entries
+
+    def _arm(self):
+        if not self._heap:
+            return
+
+        due = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self.connection.remove_timeout(self._timer)
+
+        self._timer_due = due
+        self._timer = self.connection.call_later(max(0.0, due - time.monotonic()), self._fire)
+
+    def _fire(self):
+        self._timer = None
+        self._timer_due = None
+
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, order_id, status = heapq.heappop(self._heap)
+            self.on_due(order_id, status)
+
+        self._arm()
@@ -1,187 +1,151 @@
-import json
-import random
-import time
-import pika
-import uuid
 import threading
+import time
+from client.src.order_codec import decode_order
 from client.src.simple_order import SimpleOrder
+from config import topology
+from config.rabbit_mq_config import retry_dead_letter
+from core.order_store import is_behind
+from core.service import Service
 from core.settings import settings
+from delivery.src.courier_dispatcher import CourierDispatcher
+from delivery.src.delivery_scheduler import DeliveryScheduler
+
+class DeliveryService(Service):
+    def __init__(self, order_store=None, transport=None):
+        super().__init__("Entregas", 'delivery', ("ENTREGUE",), order_store, transport,
+                         prefetch_count=settings.delivery_prefetch_count,
+                         worker_pool_size=settings.delivery_worker_pool_size)
+
+    def connect(self, transport):
+        super().connect(transport)
+        self.delivery_scheduler = DeliveryScheduler(self.rabbit.connection,
+                                                    self.on_delivery_due)
+        self.rabbit.on_reconnect(self.delivery_scheduler.attach)
+        self.dispatcher = CourierDispatcher(self.label, self.delivery_scheduler.schedule, self.publish_route_status,
+                                            couriers=settings.delivery_couriers,
+                                            capacity=settings.delivery_courier_capacity,
+                                            window=settings.delivery_batch_window)
+
+    def consumers(self):
+        return [
+            ('confirmado_entregador_dead_queue', self.dl_order_confirmed_callback),
+            ('confirmado_entregador_queue', self.order_confirmed_callback),
+        ]
+
+    def ack_later(self, ch, delivery_tag: int):
+        def ack():
+            if ch.is_open:
+                ch.basic_ack(delivery_tag=delivery_tag)
+        return ack
+
+    def send_delivery(self, order: SimpleOrder, ack):
+        if order.status not in ("CONFIRMADO", "EM ROTA"):
+            self.log.info(f"Pedido {order.order_id} não confirmado.", order_id=order.order_id)
+            ack()
+            return
 
-class DeliveryService:
-    def __init__(self):
-        self.service_id = str(uuid.uuid4())[:8]
-        self.orders = {}
-
-        credentials = pika.PlainCredentials(
-            settings.rabbitmq_user, 
-            settings.rabbitmq_pass
-        )
-
-        parameters = pika.ConnectionParameters(
-            settings.rabbitmq_host,
-            settings.rabbitmq_port,
-            settings.rabbitmq_vhost,
-            credentials
-        )
-
-        self.__consumer_service_setup(parameters)
-        self.__producer_service_setup(parameters)
-
-        self._consume_thread = None
-        print(f"[Entregas {self.service_id}] Serviço iniciado.")
-
-    def __consumer_service_setup(self, parameters):
-        self.connection_consumer = pika.BlockingConnection(parameters)
-        self.channel_consumer = self.connection_consumer.channel()
-        
-        self.channel_consumer.exchange_declare(exchange='pedido_confirmado_dlx',
-                                              exchange_type='fanout',
-                                              durable=True)
-
-        self.pedido_confirmado_dead_queue = self.channel_consumer.queue_declare(
-            queue='pedido_confirmado_dead_queue', durable=True
-        ).method.queue
+        # O ack só sai quando a rota ganha um entregador: os pedidos aguardando ficam limitados ao prefetch
+        # e o excedente continua em confirmado_entregador_queue, visível para o controle de admissão.
+        if not self.dispatcher.submit(order.order_id, order.status, ack):
+            ack()
 
-        self.channel_consumer.queue_bind(exchange='pedido_confirmado_dlx',
-                                        queue=self.pedido_confirmado_dead_queue)
+    def publish_delivery_status(self, order_id: str, status: str):
+        self.update_order_status(order_id, status)
+        self.print_order_status(order_id)
 
-        self.channel_consumer.basic_consume(queue=self.pedido_confirmado_dead_queue,
-                                            on_message_callback=self.dl_order_confirmed_callback,
-                                            auto_ack=False)
+        self._publish_order(exchange='entrega_exchange',
+                            routing_key='entrega.todos',
+                            order=self.orders.get(order_id))
+
+    def publish_route_status(self, order_ids, status: str):
+        messages = []
+        for order_id in order_ids:
+            self.update_order_status(order_id, status)
+            self.print_order_status(order_id)
+            order = self.orders.get(order_id)
+            if order is not None:
+                messages.append(self.order_message(order))
+
+        if messages:
+            self.rabbit.publish_batch('entrega_exchange', 'entrega.todos', messages,
+                                      content_type=self.codec.content_type, priority=topology.priority(status))
+
+    def on_delivery_due(self, key: str, event: str):
+        self.dispatcher.on_due(key, event)
+
+    def hand_off(self, order_id: str):
+        order = self.orders.get(order_id)
+        if order is None:
+            return
 
-        self.channel_consumer.exchange_declare(exchange='pedido_confirmado_exchange',
-                                            exchange_type='topic',
-                                            durable=True)
-        
-        arguments = {
-            'x-message-ttl': 30000,
-            'x-dead-letter-exchange': 'pedido_confirmado_dlx'
-        }
-
-        self.pedido_confirmado_queue = self.channel_consumer.queue_declare(
-            queue='confirmado_entregador_queue', durable=True, arguments=arguments
-        ).method.queue
-        
-        self.channel_consumer.queue_bind(exchange='pedido_confirmado_exchange',
-                                        queue=self.pedido_confirmado_queue,
-                                        routing_key='pedido.confirmado.*')     
-        
-        self.channel_consumer.basic_consume(queue=self.pedido_confirmado_queue,
-                                            on_message_callback=self.order_confirmed_callback,
-                                            auto_ack=False)
+        exchange, routing_key = topology.direct_route('confirmado_entregador_queue')
+        self._publish_order(exchange=exchange, routing_key=routing_key, order=order)
 
-    def __producer_service_setup(self, parameters):
-        self.connection_publisher = pika.BlockingConnection(parameters)
-        self.channel_publisher = self.connection_publisher.channel()
-        
-        self.channel_publisher.exchange_declare(exchange='entrega_exchange',
-                                                exchange_type='topic',
-                                                durable=True)
+    def hand_off_deliveries(self):
+        self.delivery_scheduler.drain()
+        pending, acks = self.dispatcher.drain()
+        for order_id in pending:
+            self.hand_off(order_id)
+        for ack in acks:
+            ack()
 
-    def send_delivery(self, order: SimpleOrder):
-        if order.status != "CONFIRMADO":
-            print(f"[Entregas {self.service_id}] Pedido {order.order_id} não confirmado.")
-            return
-                  
-        order_id = order.order_id    
-        self.update_order_status(order_id, "EM ROTA")
-        self.print_order_status(order_id)
-        
-        self.channel_publisher.basic_publish(
-            exchange='entrega_exchange',
-            routing_key='entrega.todos',
-            body=self.orders[order.order_id].model_dump_json(),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.DeliveryMode.Persistent
-            ))
-            
-        time.sleep(random.randint(15, 25))
-    
-        order_id = order.order_id 
-        self.update_order_status(order_id, "ENTREGUE")
-        self.print_order_status(order_id)
-        
-        self.channel_publisher.basic_publish(
-            exchange='entrega_exchange',
-            routing_key='entrega.todos',
-            body=self.orders[order.order_id].model_dump_json(),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.DeliveryMode.Persistent
-            ))              
+        if pending:
+            self.log.info(f"{len(pending)} entregas em andamento devolvidas à fila.", pending=len(pending))
 
     def order_confirmed_callback(self, ch, method, properties, body):
-        order_json = json.loads(body)
-        order_object = SimpleOrder(**order_json)
+        order_object = decode_order(body, properties)
         
-        if self.orders.get(order_object.order_id) is None:
-            self.orders[order_object.order_id] = order_object
-            
-        if self.orders[order_object.order_id].status in ["RECEBIDO", "FINALIZADO"]:
-            print(f"[Entregas {self.service_id}] Pedido {order_object.order_id} já foi finalizado.")
+        self.orders.track(order_object)
+
+        current = self.orders.status(order_object.order_id)
+        if is_behind(order_object.status, current):
+            self.log.info(f"Pedido {order_object.order_id} já está {current}.", order_id=order_object.order_id)
             ch.basic_ack(delivery_tag=method.delivery_tag)
             return
         
-        time.sleep(random.randint(3, 15))
-        
         order_id = order_object.order_id
         self.update_order_status(order_id, order_object.status)    
         self.print_order_status(order_id)
 
-        time.sleep(random.randint(3, 15))
-        
-        ch.basic_ack(delivery_tag=method.delivery_tag)
-
-        self.send_delivery(order_object)
-
-    def _extract_original_routing_key(self, properties, default):
-        try:
-            headers = properties.headers or {}
-            x_death = headers.get('x-death')
-            if x_death and isinstance(x_death, list) and len(x_death) > 0:
-                first = x_death[0]
-                if 'routing-keys' in first and isinstance(first['routing-keys'], list) and len(first['routing-keys']) > 0:
-                    return first['routing-keys'][0]
-                if 'routing_key' in first:
-                    return first['routing_key']
-        except Exception:
-            pass
-        return default
+        self.send_delivery(order_object, self.ack_later(ch, method.delivery_tag))
 
     def dl_order_confirmed_callback(self, ch, method, properties, body):
-        routing_key = self._extract_original_routing_key(properties, default='pedido.confirmado.retry')
-        try:
-            self.channel_publisher.basic_publish(
-                exchange='pedido_confirmado_exchange',
-                routing_key=routing_key,
-                body=body,
-                properties=pika.BasicProperties(
-                    delivery_mode=pika.DeliveryMode.Persistent,
-                    headers=properties.headers
-                )
-            )
-            print(f"[Entregas {self.service_id}] Mensagem da DLQ pedido_confirmado republicada para pedido_confirmado_exchange ({routing_key}).")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"[Entregas {self.service_id}] Falha ao republicar da DLQ pedido_confirmado: {e}. Requeue na DLQ.")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-        
-    def update_order_status(self, order_id: str, new_status: str):
-        order = self.orders[order_id]
-        if order:
-            order.status = new_status
-
-    def print_order_status(self, order_id: str):
-        order_object = self.orders[order_id]
-        if order_object is not None:
-            print(f"[Entregas {self.service_id}] Pedido {order_object.order_id} {order_object.status}.")
+        retry_dead_letter(self._publish, self.log, ch, method, properties, body,
+                          queue='confirmado_entregador_queue')
 
     def listen(self):
-        print(f"[Entregas {self.service_id}] Aguardando atualizações...")
-        self.channel_consumer.start_consuming()
+        self.log.info("Aguardando atualizações...")
+        self.rabbit.start_consuming()
+        self.rabbit.drain(time.monotonic() + settings.drain_timeout, busy=self.dispatcher.pending)
+        self.hand_off_deliveries()
+
+    def start(self):
+        self._consume_thread = threading.Thread(target=self.listen, daemon=True)
+        self._consume_thread.start()
+
+    def stop(self):
+        if self._consume_thread is not None:
+            self.rabbit.stop_consuming()
+            self._consume_thread.join()
+            self._consume_thread = None
+        self.rabbit.close()
+        self.orders.close()
+        self.tracer.close()
+
+        stats = self.dispatcher.stats()
+        self.log.info(f"Despacho: {stats['delivered']} pedidos em {stats['routes']} rotas "
+                      f"({stats['orders_per_route']} por rota), {stats['throughput']} pedidos/s, "
+                      f"utilização dos entregadores {stats['utilization']:.0%}.", **stats)
+        self.log.info("Conexão fechada.")
+
+    def serve(self, stopped: threading.Event):
+        self.start()
+        stopped.wait()
+        self.log.info("Encerrando.")
+        self.stop()
 
     def run(self):
-        consumer_thread = threading.Thread(target=self.listen, daemon=True)
-        consumer_thread.start()
+        self.start()
         
         try:
             while True:
@@ -189,24 +153,14 @@ class DeliveryService:
                     f"[Entregas {self.service_id}] Pressione 'q' para sair.\n")
                 
                 if user_input.lower() == 'q':
-                    print(f"[Entregas {self.service_id}] Encerrando.")
+                    self.log.info("Encerrando.")
                     break
                 
         except KeyboardInterrupt:
-            print(f"\n[Entregas {self.service_id}] Keyboard interruption.")
+            self.log.info("Keyboard interruption.")
         
         finally:
-            if self.channel_consumer.is_open:
-                self.channel_consumer.connection.add_callback_threadsafe(
-                    lambda: self.channel_consumer.stop_consuming()  
-                )
-
-            consumer_thread.join()
-            
-            if self.connection_consumer.is_open:
-                self.connection_consumer.close()
-                
-            print(f"[Entregas {self.service_id}] Conexão fechada.")
+            self.stop()
 
 if __name__ == '__main__':
     svc = DeliveryService()
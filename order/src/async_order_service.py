@@ -0,0 +1,45 @@
+import asyncio
+from client.src.order_codec import decode_order
+from core.service import AsyncService
+from core.simulation import simulated_delay
+from order.src.order_service import OrderService
+
+class AsyncOrderService(AsyncService, OrderService):
+    async def order_status_callback(self, ch, method, properties, body):
+        order_object = decode_order(body, properties)
+
+        await asyncio.sleep(simulated_delay(3, 15))
+
+        self.orders.track(order_object)
+
+        order_id = order_object.order_id
+
+        if order_object.status == "RECEBIDO":
+            self.update_order_status(order_id, "FINALIZADO")
+            self.print_order_status(order_id)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        if not self.update_order_status(order_id, "CONFIRMADO"):
+            self.log.info(f"Pedido {order_id} já avançou além de CONFIRMADO.", order_id=order_id)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        self.print_order_status(order_id)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        self.send_order_confirmation(self.orders.get(order_object.order_id))
+
+    async def delivery_callback(self, ch, method, properties, body):
+        order_object = decode_order(body, properties)
+
+        self.orders.track(order_object)
+
+        await asyncio.sleep(simulated_delay(3, 15))
+
+        self.update_order_status(order_object.order_id, order_object.status)
+        self.print_order_status(order_object.order_id)
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
+if __name__ == '__main__':
+    svc = AsyncOrderService()
+    svc.run()
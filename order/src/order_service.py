@@ -1,140 +1,37 @@
-import json
-import random
-import uuid
 import threading
 import time
-import pika
+from config.rabbit_mq_config import retry_dead_letter
+from core.service import Service
 from core.settings import settings
+from core.simulation import simulated_delay
+from client.src.order_codec import decode_order
 from client.src.simple_order import SimpleOrder
 
-class OrderService:
-    def __init__(self):
-        self.service_id = str(uuid.uuid4())[:8]
-        self.orders = {}
+class OrderService(Service):
+    def __init__(self, order_store=None, transport=None):
+        super().__init__("Pedidos", 'order', ("FINALIZADO",), order_store, transport,
+                         prefetch_count=settings.order_prefetch_count,
+                         worker_pool_size=settings.order_worker_pool_size)
 
-        credentials = pika.PlainCredentials(
-            settings.rabbitmq_user, 
-            settings.rabbitmq_pass
-        )
-
-        parameters = pika.ConnectionParameters(
-            settings.rabbitmq_host,
-            settings.rabbitmq_port,
-            settings.rabbitmq_vhost,
-            credentials
-        )
-        
-        self.__consumer_service_setup(parameters)
-        self.__producer_service_setup(parameters)
-
-        self._consume_thread = None
-        print(f"[Pedidos {self.service_id}] Serviço iniciado.")
-    
-    def __consumer_service_setup(self, parameters):
-        self.connection_consumer = pika.BlockingConnection(parameters)
-        self.channel_consumer = self.connection_consumer.channel()
-        self.__set_pedido_status_service()
-        self.__set_entrega_service()
-    
-    def __set_pedido_status_service(self):
-        self.channel_consumer.exchange_declare(exchange='pedido_status_dlx',
-                                               exchange_type='fanout',
-                                               durable=True)
-
-        self.pedido_status_dead_queue = self.channel_consumer.queue_declare(
-            queue='pedido_status_dead_queue', durable=True
-        ).method.queue
-
-        self.channel_consumer.queue_bind(exchange='pedido_status_dlx',
-                                         queue=self.pedido_status_dead_queue)
-
-        self.channel_consumer.basic_consume(queue=self.pedido_status_dead_queue,
-                                            on_message_callback=self.dl_pedido_status_callback,
-                                            auto_ack=False)
-
-        self.channel_consumer.exchange_declare(exchange='pedido_status_exchange',
-                                               exchange_type='direct',
-                                               durable=True)
-        
-        arguments = {
-            'x-message-ttl': 30000,
-            'x-dead-letter-exchange': 'pedido_status_dlx'
-        }
-
-        self.pedido_status_queue = self.channel_consumer.queue_declare(
-            queue='pedido_status_queue', durable=True, arguments=arguments
-        ).method.queue
-
-        self.channel_consumer.queue_bind(exchange='pedido_status_exchange',
-                                         queue=self.pedido_status_queue,
-                                         routing_key='pedido.status')
-        
-        self.channel_consumer.basic_consume(queue=self.pedido_status_queue,
-                                            on_message_callback=self.order_status_callback,
-                                            auto_ack=False)
-        
-    def __set_entrega_service(self):
-        self.channel_consumer.exchange_declare(exchange='entrega_dlx',
-                                               exchange_type='fanout',
-                                               durable=True)
-
-        self.entrega_dead_queue = self.channel_consumer.queue_declare(
-            queue='entrega_dead_queue', durable=True
-        ).method.queue
-
-        self.channel_consumer.queue_bind(exchange='entrega_dlx',
-                                         queue=self.entrega_dead_queue)
-
-        self.channel_consumer.basic_consume(queue=self.entrega_dead_queue,
-                                            on_message_callback=self.dl_entrega_callback,
-                                            auto_ack=False)
-
-        self.channel_consumer.exchange_declare(exchange='entrega_exchange',
-                                               exchange_type='topic',
-                                               durable=True)
-        
-        arguments = {
-            'x-message-ttl': 30000,
-            'x-dead-letter-exchange': 'entrega_dlx'
-        }
-
-        self.entrega_status_queue = self.channel_consumer.queue_declare(
-            queue='entrega_status_queue', durable=True, arguments=arguments
-        ).method.queue 
-
-        self.channel_consumer.queue_bind(exchange='entrega_exchange',
-                                         queue=self.entrega_status_queue,
-                                         routing_key='entrega.*')
-    
-        self.channel_consumer.basic_consume(queue=self.entrega_status_queue,
-                                            on_message_callback=self.delivery_callback,
-                                            auto_ack=False) 
-
-    def __producer_service_setup(self, parameters):
-        self.connection_publisher = pika.BlockingConnection(parameters)
-        self.channel_publisher = self.connection_publisher.channel()
-        
-        self.channel_publisher.exchange_declare(exchange='pedido_confirmado_exchange',
-                                                exchange_type='topic',
-                                                durable=True)
+    def consumers(self):
+        return [
+            ('pedido_status_dead_queue', self.dl_pedido_status_callback),
+            ('pedido_status_queue', self.order_status_callback),
+            ('entrega_status_dead_queue', self.dl_entrega_callback),
+            ('entrega_status_queue', self.delivery_callback),
+        ]
 
     def send_order_confirmation(self, order: SimpleOrder):
-        self.channel_publisher.basic_publish(
-            exchange='pedido_confirmado_exchange',
-            routing_key='pedido.confirmado.todos',
-            body=self.orders[order.order_id].model_dump_json(),
-            properties=pika.BasicProperties(
-                delivery_mode=pika.DeliveryMode.Persistent
-            ))
+        self._publish_order(exchange='pedido_confirmado_exchange',
+                            routing_key='pedido.confirmado.todos',
+                            order=self.orders.get(order.order_id))
 
     def order_status_callback(self, ch, method, properties, body):
-        order_json = json.loads(body)
-        order_object = SimpleOrder(**order_json)
+        order_object = decode_order(body, properties)
         
-        time.sleep(random.randint(3, 15))
+        time.sleep(simulated_delay(3, 15))
 
-        if self.orders.get(order_object.order_id) is None:
-            self.orders[order_object.order_id] = order_object
+        self.orders.track(order_object)
         
         order_id = order_object.order_id
         
@@ -144,91 +41,62 @@ class OrderService:
             ch.basic_ack(delivery_tag=method.delivery_tag)
             return                
         
-        self.update_order_status(order_id, "CONFIRMADO")
+        if not self.update_order_status(order_id, "CONFIRMADO"):
+            self.log.info(f"Pedido {order_id} já avançou além de CONFIRMADO.", order_id=order_id)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
         self.print_order_status(order_id)
         ch.basic_ack(delivery_tag=method.delivery_tag)
-        self.send_order_confirmation(self.orders[order_object.order_id])
+        self.send_order_confirmation(self.orders.get(order_object.order_id))
 
     def delivery_callback(self, ch, method, properties, body):
-        order_json = json.loads(body)
-        order_object = SimpleOrder(**order_json)
+        order_object = decode_order(body, properties)
         
-        if self.orders.get(order_object.order_id) is None:
-            self.orders[order_object.order_id] = order_object
+        self.orders.track(order_object)
 
-        time.sleep(random.randint(3, 15))
+        time.sleep(simulated_delay(3, 15))
         
         self.update_order_status(order_object.order_id, order_object.status)
         self.print_order_status(order_object.order_id)
         ch.basic_ack(delivery_tag=method.delivery_tag)
 
-    def _extract_original_routing_key(self, properties, default):
-        try:
-            headers = properties.headers or {}
-            x_death = headers.get('x-death')
-            if x_death and isinstance(x_death, list) and len(x_death) > 0:
-                first = x_death[0]
-                if 'routing-keys' in first and isinstance(first['routing-keys'], list) and len(first['routing-keys']) > 0:
-                    return first['routing-keys'][0]
-                if 'routing_key' in first:
-                    return first['routing_key']
-        except Exception:
-            pass
-        return default
-
     def dl_pedido_status_callback(self, ch, method, properties, body):
-        routing_key = self._extract_original_routing_key(properties, default='pedido.status.retry')
-        try:
-            self.channel_publisher.basic_publish(
-                exchange='pedido_status_exchange',
-                routing_key=routing_key,
-                body=body,
-                properties=pika.BasicProperties(
-                    delivery_mode=pika.DeliveryMode.Persistent,
-                    headers=properties.headers
-                )
-            )
-            print(f"[Pedidos {self.service_id}] Mensagem da DLQ pedido_status republicada para pedido_status_exchange ({routing_key}).")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"[Pedidos {self.service_id}] Falha ao republicar da DLQ pedido_status: {e}. Requeue na DLQ.")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+        retry_dead_letter(self._publish, self.log, ch, method, properties, body,
+                          queue='pedido_status_queue')
 
     def dl_entrega_callback(self, ch, method, properties, body):
-        routing_key = self._extract_original_routing_key(properties, default='entrega.retry')
-        try:
-            self.channel_publisher.basic_publish(
-                exchange='entrega_exchange',
-                routing_key=routing_key,
-                body=body,
-                properties=pika.BasicProperties(
-                    delivery_mode=pika.DeliveryMode.Persistent,
-                    headers=properties.headers
-                )
-            )
-            print(f"[Pedidos {self.service_id}] Mensagem da DLQ entrega republicada para entrega_exchange ({routing_key}).")
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-        except Exception as e:
-            print(f"[Pedidos {self.service_id}] Falha ao republicar da DLQ entrega: {e}. Requeue na DLQ.")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
-        
-    def update_order_status(self, order_id: str, new_status: str):
-        order = self.orders[order_id]
-        if order:
-            order.status = new_status
-            
-    def print_order_status(self, order_id: str):
-        order_object = self.orders[order_id]
-        if order_object is not None:
-            print(f"[Pedidos {self.service_id}] Pedido {order_object.order_id} {order_object.status}.")
+        retry_dead_letter(self._publish, self.log, ch, method, properties, body,
+                          queue='entrega_status_queue')
 
     def listen(self):
-        print(f"[Pedidos {self.service_id}] Aguardando atualizações...")
-        self.channel_consumer.start_consuming()
+        self.log.info("Aguardando atualizações...")
+        self.rabbit.start_consuming()
+        self.rabbit.drain(time.monotonic() + settings.drain_timeout)
+
+    def start(self):
+        self._consume_thread = threading.Thread(target=self.listen, daemon=True)
+        self._consume_thread.start()
+
+    def stop(self):
+        if self._consume_thread is not None:
+            self.rabbit.stop_consuming()
+            self._consume_thread.join()
+            self._consume_thread = None
+        self.rabbit.close()
+        self.orders.close()
+        self.tracer.close()
+
+        self.log.info("Conexão fechada.")
+
+    def serve(self, stopped: threading.Event):
+        self.start()
+        stopped.wait()
+        self.log.info("Encerrando.")
+        self.stop()
 
     def run(self):
-        consumer_thread = threading.Thread(target=self.listen, daemon=True)
-        consumer_thread.start()
+        self.start()
         
         try:
             while True:
@@ -236,24 +104,14 @@ class OrderService:
                     f"[Pedidos {self.service_id}] Pressione 'q' para sair.\n")
                 
                 if user_input.lower() == 'q':
-                    print(f"[Pedidos {self.service_id}] Encerrando.")
+                    self.log.info("Encerrando.")
                     break
                 
         except KeyboardInterrupt:
-            print(f"\n[Pedidos {self.service_id}] Keyboard interruption.")
+            self.log.info("Keyboard interruption.")
         
         finally:
-            if self.channel_consumer.is_open:
-                self.channel_consumer.connection.add_callback_threadsafe(
-                    lambda: self.channel_consumer.stop_consuming()  
-                )
-
-            consumer_thread.join()
-            
-            if self.connection_consumer.is_open:
-                self.connection_consumer.close()
-                
-            print(f"[Pedidos {self.service_id}] Conexão fechada.")
+            self.stop()
 
 if __name__ == '__main__':
     svc = OrderService()
@@ -0,0 +1,8 @@
+import os
+
+os.environ.setdefault('RABBITMQ_USER', 'guest')
+os.environ.setdefault('RABBITMQ_PASS', 'guest')
+os.environ.setdefault('RABBITMQ_HOST', 'localhost')
+os.environ.setdefault('RABBITMQ_PORT', '5672')
+os.environ.setdefault('RABBITMQ_VHOST', '/')
+os.environ.setdefault('RETRY_BASE_DELAY_MS', '20')
@@ -0,0 +1,48 @@
+import time
+import pytest
+from client.src.simple_order import SimpleOrder
+from config import topology
+from core.memory_broker import MemoryBroker, MemoryRabbit
+from core.settings import settings
+from order.src.order_service import OrderService
+
+
+class FailingOrderService(OrderService):
+    def __init__(self, *args, **kwargs):
+        self.attempts = 0
+        super().__init__(*args, **kwargs)
+
+    def order_status_callback(self, ch, method, properties, body):
+        self.attempts += 1
+        raise RuntimeError("falha simulada")
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.mark.parametrize('pool_size', [0, 2])
+def test_failing_message_is_parked_after_max_attempts(pool_size):
+    broker = MemoryBroker()
+
+    def transport(label, prefetch_count, worker_pool_size):
+        return MemoryRabbit(broker, label, prefetch_count, pool_size)
+
+    service = FailingOrderService(transport=transport)
+    service.start()
+    try:
+        service._publish_order('pedido_status_exchange', 'pedido.status', SimpleOrder.create_random())
+
+        parking = topology.parking_queue('pedido_status_queue')
+        assert wait_for(lambda: broker.queue_depth(parking) == (1, 0))
+        assert service.attempts == settings.retry_max_attempts + 1
+        assert broker.queue_depth('pedido_status_queue') == (0, 0)
+        assert broker.queue_depth(topology.dead_queue('pedido_status_queue')) == (0, 0)
+    finally:
+        service.stop()
+        broker.close()